@@ -56,7 +56,7 @@ gcloud run deploy $SERVICE_NAME \
     --allow-unauthenticated \
     --memory 512Mi \
     --cpu 1 \
-    --max-instances 10 \
+    --max-instances 1 \
     --timeout 300 \
     --set-env-vars "LOG_LEVEL=INFO,JC_TIMEZONE=America/Los_Angeles,JC_SOURCE_LABEL=buffer-label,JC_PROCESSED_LABEL=jc-processed,JC_CAL_PREFIX=Journal Club – "
 
@@ -0,0 +1,18 @@
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = 1  # The /run job registry is per process
+timeout = 300
+
+# Import the app in the master so workers fork with heavy modules, compiled regexes and the
+# category index already loaded
+preload_app = True
+
+def when_ready(arbiter):
+    from main import warm_up
+    warm_up(local=True, clients=False)
+
+def post_fork(arbiter, worker):
+    # Secret Manager's gRPC channel and the API transports must not cross a fork
+    from server import start_warm_up
+    start_warm_up(local=False)
@@ -1,29 +1,55 @@
 import os
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from typing import TYPE_CHECKING, Dict, List, Optional
+from .executor import timed
 from .models import Services
 
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+# The Google client stack is imported on first use, keeping it off the import path of main and server
+
+# Socket timeout for the persistent API transports
+HTTP_TIMEOUT_SECONDS = 60
+
+# Access tokens are refreshed this long before they expire
+REFRESH_MARGIN_SECONDS = 300
+
+_services: Optional[Services] = None
+_services_lock = threading.Lock()
+
+_secret_client = None
+_secret_client_lock = threading.Lock()
+
 # Separate scopes for different auth methods
 GMAIL_SCOPES: List[str] = ["https://www.googleapis.com/auth/gmail.readonly"]
 CALENDAR_SCOPES: List[str] = ["https://www.googleapis.com/auth/calendar"]
 
+def _project_id() -> Optional[str]:
+    return os.environ.get("GCP_PROJECT") or os.environ.get("GOOGLE_CLOUD_PROJECT")
+
+def _get_secret_client():
+    """One Secret Manager client (and its gRPC channel) per process"""
+    global _secret_client
+    with _secret_client_lock:
+        if _secret_client is None:
+            from google.cloud import secretmanager
+            _secret_client = secretmanager.SecretManagerServiceClient()
+        return _secret_client
+
 def _get_secret_from_gcp(secret_name: str) -> Optional[str]:
     """Fetch secret from Google Secret Manager"""
     try:
-        from google.cloud import secretmanager
-        client = secretmanager.SecretManagerServiceClient()
-        project_id = os.environ.get("GCP_PROJECT") or os.environ.get("GOOGLE_CLOUD_PROJECT")
+        project_id = _project_id()
         if not project_id:
             return None
         name = f"projects/{project_id}/secrets/{secret_name}/versions/latest"
-        response = client.access_secret_version(request={"name": name})
+        response = _get_secret_client().access_secret_version(request={"name": name})
         return response.payload.data.decode("UTF-8")
     except Exception as e:
         logging.warning(f"Could not fetch secret {secret_name} from Secret Manager: {e}")
@@ -32,14 +58,12 @@ def _get_secret_from_gcp(secret_name: str) -> Optional[str]:
 def _update_secret_in_gcp(secret_name: str, secret_value: str) -> bool:
     """Update secret in Google Secret Manager"""
     try:
-        from google.cloud import secretmanager
-        client = secretmanager.SecretManagerServiceClient()
-        project_id = os.environ.get("GCP_PROJECT") or os.environ.get("GOOGLE_CLOUD_PROJECT")
+        project_id = _project_id()
         if not project_id:
             return False
         parent = f"projects/{project_id}/secrets/{secret_name}"
         payload = secret_value.encode("UTF-8")
-        response = client.add_secret_version(
+        _get_secret_client().add_secret_version(
             request={"parent": parent, "payload": {"data": payload}}
         )
         logging.info(f"Updated secret {secret_name} in Secret Manager")
@@ -48,113 +72,220 @@ def _update_secret_in_gcp(secret_name: str, secret_value: str) -> bool:
         logging.warning(f"Could not update secret {secret_name} in Secret Manager: {e}")
         return False
 
-def _gmail_credentials() -> Credentials:
-    """Get OAuth credentials for Gmail with automatic refresh"""
-    tokens_dir = Path("tokens")
-    token_path = tokens_dir / "token.json"
-    client_secret_path = tokens_dir / "client_secret.json"
-
-    # Try to get credentials from Secret Manager first (Cloud Run)
-    token_json = _get_secret_from_gcp("oauth-token")
-    client_secret_json = _get_secret_from_gcp("oauth-client-secret")
-    
-    # Fall back to environment variables
-    if not token_json:
-        token_json = os.environ.get("JC_TOKEN")
-    if not client_secret_json:
-        client_secret_json = os.environ.get("JC_CLIENT_SECRET")
-    
-    # Fall back to local files
-    if not token_json and token_path.exists():
-        token_json = token_path.read_text(encoding="utf-8")
-    if not client_secret_json and client_secret_path.exists():
-        client_secret_json = client_secret_path.read_text(encoding="utf-8")
-    
-    if not client_secret_json:
-        raise ValueError("No OAuth client secret found. Please set up OAuth credentials.")
-    
-    # Write to temp files for use
-    tmp_dir = Path("/tmp")
-    tmp_client_secret = tmp_dir / "client_secret.json"
-    tmp_client_secret.write_text(client_secret_json, encoding="utf-8")
-    
-    creds = None
-    if token_json:
-        # Load existing credentials
-        creds = Credentials.from_authorized_user_info(json.loads(token_json), GMAIL_SCOPES)
-    
-    # Refresh or create new credentials
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            logging.info("Refreshing expired OAuth token...")
+def _seconds_left(creds) -> Optional[float]:
+    if creds.expiry is None:
+        return None
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth keeps expiry as naive UTC
+    return (creds.expiry - now).total_seconds()
+
+class CredentialManager:
+    """
+    Resolves the Gmail and Calendar credentials once per process and keeps their access tokens
+    fresh: a background timer refreshes them REFRESH_MARGIN_SECONDS before expiry, and
+    ensure_fresh() covers processes whose timers could not run (e.g. CPU throttled between requests).
+    The stored token is rewritten only when Google issues a new refresh token.
+    """
+
+    def __init__(self) -> None:
+        self._gmail = None
+        self._calendar = None
+        self._persisted_refresh_token: Optional[str] = None
+        self._request = None
+        self._timer: Optional[threading.Timer] = None
+        # Separate load locks so Gmail and Calendar credentials can be resolved concurrently
+        self._gmail_lock = threading.Lock()
+        self._calendar_lock = threading.Lock()
+        self._lock = threading.RLock()
+
+    def _transport(self):
+        # One requests.Session for all token refreshes
+        with self._lock:
+            if self._request is None:
+                from google.auth.transport.requests import Request
+                self._request = Request()
+            return self._request
+
+    def gmail_credentials(self) -> "Credentials":
+        with self._gmail_lock:
+            if self._gmail is None:
+                self._gmail = self._load_gmail_credentials()
+                with self._lock:
+                    self._schedule_refresh()
+            return self._gmail
+
+    def calendar_credentials(self):
+        with self._calendar_lock:
+            if self._calendar is None:
+                self._calendar = self._load_calendar_credentials()
+                with self._lock:
+                    self._schedule_refresh()
+            return self._calendar
+
+    def _load_gmail_credentials(self) -> "Credentials":
+        """Get OAuth credentials for Gmail with automatic refresh"""
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        tokens_dir = Path("tokens")
+        token_path = tokens_dir / "token.json"
+        client_secret_path = tokens_dir / "client_secret.json"
+
+        # Try to get credentials from Secret Manager first (Cloud Run)
+        token_json = _get_secret_from_gcp("oauth-token")
+
+        # Fall back to environment variables, then local files
+        if not token_json:
+            token_json = os.environ.get("JC_TOKEN")
+        if not token_json and token_path.exists():
+            token_json = token_path.read_text(encoding="utf-8")
+
+        creds = None
+        if token_json:
+            creds = Credentials.from_authorized_user_info(json.loads(token_json), GMAIL_SCOPES)
+            self._persisted_refresh_token = creds.refresh_token
+
+        left = _seconds_left(creds) if creds else None
+        if creds and creds.refresh_token and (not creds.valid or (left is not None and left < REFRESH_MARGIN_SECONDS)):
+            logging.info("Refreshing OAuth token...")
             try:
-                creds.refresh(Request())
-                # Save refreshed token
-                new_token_json = creds.to_json()
-                
-                # Update in Secret Manager (Cloud Run)
-                if not _update_secret_in_gcp("oauth-token", new_token_json):
-                    # Fall back to local file
-                    if token_path.parent.exists():
-                        token_path.write_text(new_token_json, encoding="utf-8")
-                        logging.info("Saved refreshed token to local file")
-                
-                logging.info("Successfully refreshed OAuth token")
+                self._refresh(creds)
             except Exception as e:
                 logging.error(f"Failed to refresh token: {e}")
                 creds = None
-        
+        elif creds and not creds.valid:
+            creds = None
+
         if not creds:
-            # Need to do full OAuth flow
-            logging.info("Starting OAuth flow...")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                str(tmp_client_secret), GMAIL_SCOPES
+            # The client secret is only needed for the interactive flow
+            client_secret_json = (
+                _get_secret_from_gcp("oauth-client-secret")
+                or os.environ.get("JC_CLIENT_SECRET")
+                or (client_secret_path.read_text(encoding="utf-8") if client_secret_path.exists() else None)
             )
+            if not client_secret_json:
+                raise ValueError("No OAuth client secret found. Please set up OAuth credentials.")
+            logging.info("Starting OAuth flow...")
+            flow = InstalledAppFlow.from_client_config(json.loads(client_secret_json), GMAIL_SCOPES)
             creds = flow.run_local_server(port=0)
-            
-            # Save new token
-            new_token_json = creds.to_json()
-            if not _update_secret_in_gcp("oauth-token", new_token_json):
-                if token_path.parent.exists():
-                    tokens_dir.mkdir(parents=True, exist_ok=True)
-                    token_path.write_text(new_token_json, encoding="utf-8")
-    
-    return creds
-
-def _calendar_service_account():
-    """Get service account credentials for Calendar"""
-    # Try Secret Manager first
-    sa_key_json = _get_secret_from_gcp("calendar-service-account")
-    
-    # Fall back to environment variable
-    if not sa_key_json:
-        sa_key_json = os.environ.get("CALENDAR_SERVICE_ACCOUNT")
-    
-    # Fall back to local file
-    if not sa_key_json:
-        sa_key_path = Path("tokens") / "calendar-service-account.json"
-        if sa_key_path.exists():
-            sa_key_json = sa_key_path.read_text(encoding="utf-8")
-    
-    if sa_key_json:
-        # Use service account
-        sa_info = json.loads(sa_key_json)
-        creds = service_account.Credentials.from_service_account_info(
-            sa_info, scopes=CALENDAR_SCOPES
-        )
-        logging.info("Using service account for Calendar")
+            self._persist(creds)
+
         return creds
-    else:
+
+    def _load_calendar_credentials(self):
+        """Get service account credentials for Calendar"""
+        from google.oauth2 import service_account
+        # Try Secret Manager first, then the environment, then a local file
+        sa_key_json = _get_secret_from_gcp("calendar-service-account")
+        if not sa_key_json:
+            sa_key_json = os.environ.get("CALENDAR_SERVICE_ACCOUNT")
+        if not sa_key_json:
+            sa_key_path = Path("tokens") / "calendar-service-account.json"
+            if sa_key_path.exists():
+                sa_key_json = sa_key_path.read_text(encoding="utf-8")
+
+        if sa_key_json:
+            sa_info = json.loads(sa_key_json)
+            creds = service_account.Credentials.from_service_account_info(
+                sa_info, scopes=CALENDAR_SCOPES
+            )
+            self._refresh(creds)
+            logging.info("Using service account for Calendar")
+            return creds
+
         # Fall back to user OAuth (not recommended)
         logging.warning("No service account found for Calendar, using OAuth (may expire)")
-        return _gmail_credentials()
-
-def get_authorized_services() -> Services:
-    """Get authorized services for Gmail and Calendar"""
-    gmail_creds = _gmail_credentials()
-    calendar_creds = _calendar_service_account()
-    
-    gmail = build("gmail", "v1", credentials=gmail_creds)
-    calendar = build("calendar", "v3", credentials=calendar_creds)
-    
-    return Services(gmail=gmail, calendar=calendar)
\ No newline at end of file
+        return self.gmail_credentials()
+
+    def _refresh(self, creds) -> None:
+        from google.oauth2.credentials import Credentials
+        creds.refresh(self._transport())
+        if isinstance(creds, Credentials):
+            with self._lock:
+                self._persist(creds)
+
+    def _persist(self, creds: "Credentials") -> None:
+        """Save the token only when its refresh token changed; access tokens live in memory"""
+        if not creds.refresh_token or creds.refresh_token == self._persisted_refresh_token:
+            return
+        token_json = creds.to_json()
+        if _update_secret_in_gcp("oauth-token", token_json):
+            self._persisted_refresh_token = creds.refresh_token
+            return
+        # Fall back to local file
+        token_path = Path("tokens") / "token.json"
+        token_path.parent.mkdir(parents=True, exist_ok=True)
+        token_path.write_text(token_json, encoding="utf-8")
+        self._persisted_refresh_token = creds.refresh_token
+        logging.info("Saved token to local file")
+
+    def _managed(self) -> List:
+        seen, creds = set(), []
+        for c in (self._gmail, self._calendar):
+            if c is not None and id(c) not in seen:
+                seen.add(id(c))
+                creds.append(c)
+        return creds
+
+    def ensure_fresh(self) -> None:
+        """Refresh any token that expires within the margin"""
+        with self._lock:
+            for creds in self._managed():
+                left = _seconds_left(creds)
+                if not creds.valid or (left is not None and left < REFRESH_MARGIN_SECONDS):
+                    logging.info("Refreshing access token before it expires")
+                    self._refresh(creds)
+            self._schedule_refresh()
+
+    def _schedule_refresh(self) -> None:
+        expiries = [left for left in (_seconds_left(c) for c in self._managed()) if left is not None]
+        if not expiries:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(1.0, min(expiries) - REFRESH_MARGIN_SECONDS), self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.ensure_fresh()
+        except Exception as e:
+            # The next run's ensure_fresh() or the transport's own refresh on 401 will retry
+            logging.warning(f"Background token refresh failed: {e}")
+
+CREDENTIALS = CredentialManager()
+
+def _build_service(api: str, version: str, credentials):
+    """
+    Build an API client over a persistent authorized transport. httplib2 keeps the TLS connection
+    alive between requests, and static_discovery loads the discovery document bundled with
+    google-api-python-client instead of fetching it.
+    """
+    import httplib2
+    import google_auth_httplib2
+    from googleapiclient.discovery import build
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT_SECONDS))
+    return build(api, version, http=http, static_discovery=True, cache_discovery=False)
+
+def _authorized_client(api: str, version: str, load_credentials, timings: Dict[str, float]):
+    credentials = timed(timings, f"{api}_credentials", load_credentials)
+    return timed(timings, f"{api}_client", _build_service, api, version, credentials)
+
+def get_authorized_services(refresh: bool = False, timings: Optional[Dict[str, float]] = None) -> Services:
+    """
+    Get authorized services for Gmail and Calendar.
+    Clients, their transports and credentials are created once per process and reused by later runs;
+    pass refresh=True to rebuild the clients. The two APIs resolve their secrets, refresh their
+    tokens and build their clients concurrently; per-phase seconds are added to timings if given.
+    """
+    global _services
+    timings = timings if timings is not None else {}
+    with _services_lock:
+        if _services is not None and not refresh:
+            timed(timings, "token_refresh", CREDENTIALS.ensure_fresh)
+            return _services
+
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="auth") as pool:
+            gmail = pool.submit(_authorized_client, "gmail", "v1", CREDENTIALS.gmail_credentials, timings)
+            calendar = pool.submit(_authorized_client, "calendar", "v3", CREDENTIALS.calendar_credentials, timings)
+            _services = Services(gmail=gmail.result(), calendar=calendar.result())
+        return _services
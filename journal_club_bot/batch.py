@@ -0,0 +1,80 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from .executor import EXECUTOR, is_retryable
+
+# Calendar API accepts at most 50 calls per batch request
+MAX_BATCH_SIZE = 50
+
+@dataclass
+class _BatchItem:
+    request: object
+    on_success: Callable[[dict], None]
+    on_error: Optional[Callable[[Exception], None]]
+    label: str
+
+class CalendarBatch:
+    """
+    Collects Calendar API mutations and sends them through the batch endpoint.
+    Each item's result or error is handed to its own callbacks; items that fail with a
+    retryable error are retried individually through the shared request executor.
+    """
+
+    def __init__(self, calendar) -> None:
+        self.calendar = calendar
+        self._items: List[_BatchItem] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, request, on_success: Callable[[dict], None], on_error: Optional[Callable[[Exception], None]] = None, label: str = "") -> None:
+        self._items.append(_BatchItem(request, on_success, on_error, label))
+
+    def _fail(self, item: _BatchItem, error: Exception) -> None:
+        if item.on_error:
+            item.on_error(error)
+        else:
+            logging.error(f"Calendar request failed ({item.label}): {error}")
+
+    def _retry(self, item: _BatchItem) -> None:
+        try:
+            response = EXECUTOR.execute(item.request, "calendar")
+        except Exception as e:
+            self._fail(item, e)
+            return
+        item.on_success(response)
+
+    def execute(self) -> None:
+        """Send all queued requests, MAX_BATCH_SIZE per HTTP round trip"""
+        items, self._items = self._items, []
+        for offset in range(0, len(items), MAX_BATCH_SIZE):
+            chunk = items[offset:offset + MAX_BATCH_SIZE]
+            results = {}
+
+            def callback(request_id, response, exception):
+                results[int(request_id)] = (response, exception)
+
+            if len(chunk) == 1:
+                # A single call gains nothing from the multipart envelope
+                try:
+                    results[0] = (EXECUTOR.execute(chunk[0].request, "calendar"), None)
+                except Exception as e:
+                    results[0] = (None, e)
+            else:
+                batch = self.calendar.new_batch_http_request(callback=callback)
+                for i, item in enumerate(chunk):
+                    batch.add(item.request, request_id=str(i))
+                EXECUTOR.execute(batch, "calendar", units=0)
+                for _, exception in results.values():
+                    EXECUTOR.record("calendar", exception)
+
+            logging.info(f"Executed {len(chunk)} calendar requests in one batch")
+            for i, item in enumerate(chunk):
+                response, exception = results.get(i, (None, RuntimeError("no response in batch")))
+                if exception is None:
+                    item.on_success(response)
+                elif is_retryable(exception) and len(chunk) > 1:
+                    logging.warning(f"Retrying {item.label} after error: {exception}")
+                    self._retry(item)
+                else:
+                    self._fail(item, exception)
@@ -1,49 +1,99 @@
+import hashlib
+import json
 import logging
+import re
+import time
 from typing import Dict, List, Optional
-from .models import ParsedEvent, Categories, MessageEventMap
+from .models import ParsedEvent, Categories
 from .storage import StateStore
+from .event_cache import EventWindowCache
+from .executor import execute, http_status
+from .event_index import IndexedEvent, surname
+from .batch import CalendarBatch
 
-def _calendar_summary_for_category(prefix: str, name: str) -> str:
+def calendar_summary_for_category(prefix: str, name: str) -> str:
     return f"{prefix}{name}"
 
-def ensure_category_calendars(calendar, categories: Categories, state: StateStore) -> None:
-    cal_map = state.load_calendar_map()
-    cfg = state.load_settings()
-    prefix = cfg.get("calendar_prefix", "Journal Club – ")
-    if not cfg.get("auto_create_calendars", True):
-        return
-
+def _list_calendar_directory(calendar, etag: Optional[str]):
+    """
+    Page through calendarList. With an ETag the first page is fetched conditionally;
+    returns (None, etag) when the server answers 304 Not Modified.
+    """
     existing = {}
     page_token = None
+    new_etag = None
     while True:
-        resp = calendar.calendarList().list(pageToken=page_token).execute()
+        req = calendar.calendarList().list(pageToken=page_token)
+        if etag and page_token is None:
+            req.headers["If-None-Match"] = etag
+        try:
+            resp = execute(req, "calendar")
+        except Exception as e:
+            if http_status(e) == 304:
+                return None, etag
+            raise
+        if page_token is None:
+            new_etag = resp.get("etag")
         for item in resp.get("items", []):
             existing[item["summary"]] = item["id"]
         page_token = resp.get("nextPageToken")
         if not page_token:
-            break
+            return existing, new_etag
 
-    changed = False
-    for cat in categories.categories:
-        summary = _calendar_summary_for_category(prefix, cat.name)
-        if summary not in existing:
-            body = {"summary": summary, "timeZone": cfg.get("timezone", "America/Los_Angeles")}
-            created = calendar.calendars().insert(body=body).execute()
-            existing[summary] = created["id"]
-            changed = True
+def ensure_category_calendars(calendar, categories: Categories, state: StateStore, create_missing: bool = True) -> Dict[str, str]:
+    """
+    Resolve (and create if missing) the category calendars, returning summary -> calendar ID.
+    The directory is cached in state: within calendar_list_ttl_hours no listing happens at all,
+    after that it is revalidated with a conditional (ETag) request.
+    With create_missing=False (dry runs) nothing is created or saved.
+    """
+    cal_map = state.load_calendar_map() or {}
+    cfg = state.load_settings()
+    prefix = cfg.get("calendar_prefix", "Journal Club – ")
+    if not cfg.get("auto_create_calendars", True):
+        return cal_map
 
+    required = [calendar_summary_for_category(prefix, cat.name) for cat in categories.categories]
     if categories.fallback_category:
-        summary = _calendar_summary_for_category(prefix, categories.fallback_category)
-        if summary not in existing:
+        required.append(calendar_summary_for_category(prefix, categories.fallback_category))
+
+    directory = state.load_calendar_directory() or {}
+    ttl_seconds = float(cfg.get("calendar_list_ttl_hours", 24)) * 3600
+    complete = all(summary in cal_map for summary in required)
+    if complete and time.time() - directory.get("fetched_at", 0) < ttl_seconds:
+        logging.info("Calendar directory cache is fresh, skipping calendarList")
+        return cal_map
+
+    existing, etag = _list_calendar_directory(calendar, directory.get("etag") if complete else None)
+    if existing is None:
+        logging.info("Calendar directory unchanged (304), keeping cached map")
+        if create_missing:
+            state.save_calendar_directory({"fetched_at": time.time(), "etag": etag})
+        return cal_map
+
+    # Create every missing calendar in one batch round trip
+    missing = [summary for summary in required if summary not in existing]
+    if not create_missing:
+        if missing:
+            logging.info(f"Would create calendars: {missing}")
+        return existing
+    if missing:
+        batch = CalendarBatch(calendar)
+        for summary in missing:
+            def on_created(created, summary=summary):
+                existing[summary] = created["id"]
+                logging.info(f"Created calendar: {summary}")
             body = {"summary": summary, "timeZone": cfg.get("timezone", "America/Los_Angeles")}
-            created = calendar.calendars().insert(body=body).execute()
-            existing[summary] = created["id"]
-            changed = True
+            batch.add(calendar.calendars().insert(body=body), on_created, label=f"create calendar {summary}")
+        batch.execute()
+        # The listing no longer reflects the new calendars
+        etag = None
 
-    if changed or not cal_map:
-        state.save_calendar_map(existing)
+    state.save_calendar_map(existing)
+    state.save_calendar_directory({"fetched_at": time.time(), "etag": etag})
+    return existing
 
-def _build_event_body(pe: ParsedEvent, msg_id: str) -> dict:
+def build_event_body(pe: ParsedEvent, msg_id: str) -> dict:
     # Build description with better formatting
     description_parts = []
     
@@ -120,10 +170,130 @@ def _build_event_body(pe: ParsedEvent, msg_id: str) -> dict:
     
     return body
 
-def find_existing_event(calendar, cal_id: str, parsed_event: ParsedEvent, state: StateStore) -> Optional[str]:
+def canonical_event_key(pe: ParsedEvent) -> str:
+    """Stable identity of a talk: normalized title, speaker surname and start date"""
+    title = "" if pe.title == "Journal Club" else " ".join(re.findall(r"[a-z0-9]+", (pe.title or "").lower()))
+    parts = [title, surname(pe.speaker) or "", pe.start.date().isoformat()]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+def event_ical_uid(pe: ParsedEvent) -> str:
+    return f"jc-{canonical_event_key(pe)}@journal-club-bot"
+
+# Not content: the bot's own properties and the identity fields only create bodies carry
+_UNHASHED_FIELDS = ("extendedProperties", "iCalUID", "id")
+
+def _content_hash(body: dict) -> str:
+    """Hash of the event fields the bot writes, excluding its own extended properties and identity"""
+    content = {k: v for k, v in body.items() if k not in _UNHASHED_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+def with_content_hash(body: dict) -> dict:
+    body = dict(body)
+    private = dict(body.get("extendedProperties", {}).get("private", {}))
+    private["content_hash"] = _content_hash(body)
+    body["extendedProperties"] = {"private": private}
+    return body
+
+def changed_fields(existing: dict, body: dict) -> dict:
+    """Patch body holding only the fields that differ from the existing event"""
+    patch = {}
+    for key, value in body.items():
+        if key == "extendedProperties":
+            continue
+        if existing.get(key) != value:
+            patch[key] = value
+    # Extended properties are merged by patch, so only the bot's own keys are sent
+    patch["extendedProperties"] = body["extendedProperties"]
+    return patch
+
+def score_event(parsed_event: ParsedEvent, entry: IndexedEvent) -> int:
+    """Score how well an indexed calendar event matches the parsed event"""
+    score = 0
+    event_summary = entry.summary
+    event_summary_lower = entry.summary_lower
+    event_description_lower = entry.description_lower
+    ref_lower = (parsed_event.original_event_ref or '').lower()
+    title_lower = (parsed_event.title or '').lower()
+    speaker_lower = (parsed_event.speaker or '').lower()
+    
+    # Strategy 1: Exact or substring title match (highest priority)
+    if parsed_event.original_event_ref:
+        # Check if reference matches title
+        if ref_lower in event_summary_lower or event_summary_lower in ref_lower:
+            score += 100
+            logging.debug(f"Event '{event_summary}' matches by original reference (score +100)")
+        
+        # Check if reference is in description
+        if ref_lower in event_description_lower:
+            score += 80
+            logging.debug(f"Event '{event_summary}' has reference in description (score +80)")
+    
+    # Strategy 2: Current title similarity
+    if parsed_event.title and parsed_event.title != "Journal Club":
+        # Check for exact match
+        if title_lower == event_summary_lower:
+            score += 90
+            logging.debug(f"Event '{event_summary}' exact title match (score +90)")
+        # Check for substring match
+        elif title_lower in event_summary_lower or event_summary_lower in title_lower:
+            score += 70
+            logging.debug(f"Event '{event_summary}' partial title match (score +70)")
+        # Check for word overlap (fuzzy matching)
+        elif len(title_lower) > 10:
+            title_words = set(title_lower.split())
+            summary_words = set(event_summary_lower.split())
+            common_words = title_words & summary_words
+            if len(common_words) >= 3:  # At least 3 common words
+                overlap_score = min(len(common_words) * 10, 50)
+                score += overlap_score
+                logging.debug(f"Event '{event_summary}' has {len(common_words)} common words (score +{overlap_score})")
+    
+    # Strategy 3: Speaker match
+    if parsed_event.speaker:
+        if speaker_lower in event_description_lower or speaker_lower in event_summary_lower:
+            score += 60
+            logging.debug(f"Event '{event_summary}' matches by speaker (score +60)")
+    
+    # Strategy 4: Date proximity (start times are pre-parsed by the index)
+    if parsed_event.start and entry.start:
+        try:
+            time_diff = abs((parsed_event.start - entry.start).total_seconds())
+            
+            # Score based on how close the dates are
+            if time_diff <= 24 * 3600:  # Within 1 day
+                score += 40
+                logging.debug(f"Event '{event_summary}' within 1 day (score +40)")
+            elif time_diff <= 3 * 24 * 3600:  # Within 3 days
+                score += 30
+                logging.debug(f"Event '{event_summary}' within 3 days (score +30)")
+            elif time_diff <= 7 * 24 * 3600:  # Within 1 week
+                score += 20
+                logging.debug(f"Event '{event_summary}' within 1 week (score +20)")
+            elif time_diff <= 14 * 24 * 3600:  # Within 2 weeks
+                score += 10
+                logging.debug(f"Event '{event_summary}' within 2 weeks (score +10)")
+        except TypeError:
+            # Mixed naive/aware datetimes
+            pass
+    
+    # Strategy 5: Location similarity (bonus)
+    if parsed_event.location and entry.location_lower:
+        loc_lower = parsed_event.location.lower()
+        event_loc_lower = entry.location_lower
+        if loc_lower in event_loc_lower or event_loc_lower in loc_lower:
+            score += 15
+            logging.debug(f"Event '{event_summary}' location match (score +15)")
+    
+    return score
+
+def source_message_id(event: dict) -> Optional[str]:
+    return event.get("extendedProperties", {}).get("private", {}).get("source_msg_id")
+
+def find_existing_event(calendar, cal_id: str, parsed_event: ParsedEvent, state: StateStore, cache: Optional[EventWindowCache] = None) -> Optional[str]:
     """
     Find an existing calendar event that matches the parsed event for updates.
     Uses multiple matching strategies with scoring to find the best match.
+    Events are read from the run's event cache, so each calendar window is listed once per run.
     """
     if not parsed_event.original_event_ref and not parsed_event.speaker and not parsed_event.title:
         logging.info("No identifying information for event matching")
@@ -131,116 +301,25 @@ def find_existing_event(calendar, cal_id: str, parsed_event: ParsedEvent, state:
     
     logging.info(f"Searching for existing event - ref: '{parsed_event.original_event_ref}', speaker: '{parsed_event.speaker}', title: '{parsed_event.title}'")
     
-    # Search for events in the calendar
+    if cache is None:
+        cache = EventWindowCache(calendar)
+
+    # Search for events in the calendar (past 60 days to future 60 days)
     try:
-        # Get events from the past 60 days to future 60 days (wider range)
-        from datetime import datetime, timedelta
-        time_min = (datetime.now() - timedelta(days=60)).isoformat() + 'Z'
-        time_max = (datetime.now() + timedelta(days=60)).isoformat() + 'Z'
-        
-        events_result = calendar.events().list(
-            calendarId=cal_id,
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        index = cache.index(cal_id)
+        candidates = index.candidates(parsed_event)
+        logging.info(f"Scoring {len(candidates)} of {len(index)} existing events")
         
-        events = events_result.get('items', [])
-        logging.info(f"Found {len(events)} existing events to check")
-        
-        # Score each event for matching
+        # Score each candidate event for matching
         matches = []
         
-        for event in events:
-            score = 0
-            event_id = event['id']
-            event_summary = event.get('summary', '')
-            event_description = event.get('description', '')
-            event_location = event.get('location', '')
-            
-            # Normalize for comparison
-            event_summary_lower = event_summary.lower()
-            event_description_lower = event_description.lower()
-            ref_lower = (parsed_event.original_event_ref or '').lower()
-            title_lower = (parsed_event.title or '').lower()
-            speaker_lower = (parsed_event.speaker or '').lower()
-            
-            # Strategy 1: Exact or substring title match (highest priority)
-            if parsed_event.original_event_ref:
-                # Check if reference matches title
-                if ref_lower in event_summary_lower or event_summary_lower in ref_lower:
-                    score += 100
-                    logging.debug(f"Event '{event_summary}' matches by original reference (score +100)")
-                
-                # Check if reference is in description
-                if ref_lower in event_description_lower:
-                    score += 80
-                    logging.debug(f"Event '{event_summary}' has reference in description (score +80)")
-            
-            # Strategy 2: Current title similarity
-            if parsed_event.title and parsed_event.title != "Journal Club":
-                # Check for exact match
-                if title_lower == event_summary_lower:
-                    score += 90
-                    logging.debug(f"Event '{event_summary}' exact title match (score +90)")
-                # Check for substring match
-                elif title_lower in event_summary_lower or event_summary_lower in title_lower:
-                    score += 70
-                    logging.debug(f"Event '{event_summary}' partial title match (score +70)")
-                # Check for word overlap (fuzzy matching)
-                elif len(title_lower) > 10:
-                    title_words = set(title_lower.split())
-                    summary_words = set(event_summary_lower.split())
-                    common_words = title_words & summary_words
-                    if len(common_words) >= 3:  # At least 3 common words
-                        overlap_score = min(len(common_words) * 10, 50)
-                        score += overlap_score
-                        logging.debug(f"Event '{event_summary}' has {len(common_words)} common words (score +{overlap_score})")
-            
-            # Strategy 3: Speaker match
-            if parsed_event.speaker:
-                if speaker_lower in event_description_lower or speaker_lower in event_summary_lower:
-                    score += 60
-                    logging.debug(f"Event '{event_summary}' matches by speaker (score +60)")
-            
-            # Strategy 4: Date proximity
-            if parsed_event.start:
-                event_start = event.get('start', {}).get('dateTime')
-                if event_start:
-                    from dateutil import parser as date_parser
-                    try:
-                        event_datetime = date_parser.parse(event_start)
-                        time_diff = abs((parsed_event.start - event_datetime).total_seconds())
-                        
-                        # Score based on how close the dates are
-                        if time_diff <= 24 * 3600:  # Within 1 day
-                            score += 40
-                            logging.debug(f"Event '{event_summary}' within 1 day (score +40)")
-                        elif time_diff <= 3 * 24 * 3600:  # Within 3 days
-                            score += 30
-                            logging.debug(f"Event '{event_summary}' within 3 days (score +30)")
-                        elif time_diff <= 7 * 24 * 3600:  # Within 1 week
-                            score += 20
-                            logging.debug(f"Event '{event_summary}' within 1 week (score +20)")
-                        elif time_diff <= 14 * 24 * 3600:  # Within 2 weeks
-                            score += 10
-                            logging.debug(f"Event '{event_summary}' within 2 weeks (score +10)")
-                    except:
-                        pass
-            
-            # Strategy 5: Location similarity (bonus)
-            if parsed_event.location and event_location:
-                loc_lower = parsed_event.location.lower()
-                event_loc_lower = event_location.lower()
-                if loc_lower in event_loc_lower or event_loc_lower in loc_lower:
-                    score += 15
-                    logging.debug(f"Event '{event_summary}' location match (score +15)")
+        for entry in candidates:
+            score = score_event(parsed_event, entry)
             
             # Only consider events with score > threshold
             if score >= 50:  # Minimum threshold for matching
-                matches.append((event_id, event_summary, score))
-                logging.info(f"Potential match: '{event_summary}' with score {score}")
+                matches.append((entry.event_id, entry.summary, score))
+                logging.info(f"Potential match: '{entry.summary}' with score {score}")
         
         # Select best match
         if matches:
@@ -260,145 +339,24 @@ def find_existing_event(calendar, cal_id: str, parsed_event: ParsedEvent, state:
         logging.error(f"Error searching for existing event: {e}")
         return None
 
-def handle_event_update(calendar, categories: Categories, parsed_event: ParsedEvent, msg_id: str, state: StateStore) -> MessageEventMap:
-    """Handle updates to existing calendar events"""
-    cfg = state.load_settings()
-    prefix = cfg.get("calendar_prefix", "Journal Club – ")
-    cal_map = state.load_calendar_map() or {}
-    
-    logging.info(f"Handling event update: {parsed_event.email_type}")
-    logging.info(f"Original event reference: {parsed_event.original_event_ref}")
-    
-    # Determine which calendars to update based on the original event reference
-    # For now, we'll update all calendars, but this could be made more sophisticated
-    target_summaries = []
-    for cat in categories.categories:
-        target_summaries.append(_calendar_summary_for_category(prefix, cat.name))
-    
-    if categories.fallback_category:
-        target_summaries.append(_calendar_summary_for_category(prefix, categories.fallback_category))
-    
-    mapping: Dict[str, str] = {}
-    
-    for summary in target_summaries:
-        cal_id = cal_map.get(summary)
-        if not cal_id:
-            logging.warning(f"Calendar not found: {summary}")
-            continue
-        
-        # Find the existing event
-        existing_event_id = find_existing_event(calendar, cal_id, parsed_event, state)
-        
-        if existing_event_id:
-            if parsed_event.email_type == "cancellation":
-                # Delete the event
-                try:
-                    calendar.events().delete(calendarId=cal_id, eventId=existing_event_id).execute()
-                    logging.info(f"Deleted cancelled event: {existing_event_id}")
-                    mapping[summary] = existing_event_id  # Track the deleted event
-                except Exception as e:
-                    logging.error(f"Error deleting event: {e}")
-            else:
-                # Update the event
-                try:
-                    # Get the existing event
-                    existing_event = calendar.events().get(calendarId=cal_id, eventId=existing_event_id).execute()
-                    
-                    # Update the event with new information
-                    body = _build_event_body(parsed_event, msg_id)
-                    
-                    # Preserve some original information if not provided in update
-                    if not parsed_event.title or parsed_event.title == "Journal Club":
-                        body["summary"] = existing_event.get("summary", "Journal Club")
-                    if not parsed_event.location:
-                        body["location"] = existing_event.get("location", "")
-                    
-                    updated = calendar.events().update(
-                        calendarId=cal_id, 
-                        eventId=existing_event_id, 
-                        body=body
-                    ).execute()
-                    
-                    mapping[summary] = updated["id"]
-                    logging.info(f"Updated existing event: {updated.get('htmlLink', 'no link')}")
-                    
-                except Exception as e:
-                    logging.error(f"Error updating event: {e}")
-        else:
-            logging.info(f"No existing event found to update in calendar: {summary}")
-    
-    return MessageEventMap(message_id=msg_id, category_to_event_ids=mapping)
-
-def upsert_event_to_calendars(calendar, categories: Categories, category_names: List[str], pe: ParsedEvent, msg_id: str, state: StateStore) -> MessageEventMap:
-    cfg = state.load_settings()
-    prefix = cfg.get("calendar_prefix", "Journal Club – ")
-    cal_map = state.load_calendar_map() or {}
-    mapping: Dict[str, str] = {}
-    target_summaries = [_calendar_summary_for_category(prefix, c) for c in category_names]
-
-    logging.info(f"Creating/updating event: '{pe.title}' for categories: {category_names}")
-    logging.info(f"Event time: {pe.start} to {pe.end}")
-    logging.info(f"Speaker: {pe.speaker}, Location: {pe.location}")
-    logging.info(f"Target calendars: {target_summaries}")
-
-    for summary in target_summaries:
-        cal_id = cal_map.get(summary)
-        if not cal_id:
-            logging.info(f"Calendar not found in map, ensuring it exists: {summary}")
-            ensure_category_calendars(calendar, categories, state)
-            cal_map = state.load_calendar_map() or {}
-            cal_id = cal_map.get(summary)
-            if not cal_id:
-                logging.warning("Missing calendar for %s", summary)
-                continue
-
-        logging.info(f"Using calendar: {summary} (ID: {cal_id})")
-
-        # First check if this message already created an event
-        q = calendar.events().list(calendarId=cal_id, privateExtendedProperty=f"source_msg_id={msg_id}", maxResults=1).execute()
-        items = q.get("items", [])
-        
-        if items:
-            # This exact message already created an event - update it
-            ev_id = items[0]["id"]
-            logging.info(f"Updating event from same message: {ev_id}")
-            body = _build_event_body(pe, msg_id)
-            updated = calendar.events().update(calendarId=cal_id, eventId=ev_id, body=body).execute()
-            mapping[summary] = updated["id"]
-            logging.info(f"Updated event: {updated.get('htmlLink', 'no link')}")
-        else:
-            # Check if this might be a duplicate of an existing event (even if email_type is "new")
-            # This prevents duplicates when the same event is announced multiple times
-            existing_event_id = find_existing_event(calendar, cal_id, pe, state)
-            
-            if existing_event_id:
-                logging.info(f"Found potential duplicate event: {existing_event_id}")
-                logging.info(f"Updating existing event instead of creating new one")
-                
-                # Get existing event to preserve some info
-                existing_event = calendar.events().get(calendarId=cal_id, eventId=existing_event_id).execute()
-                body = _build_event_body(pe, msg_id)
-                
-                # Update the event
-                updated = calendar.events().update(calendarId=cal_id, eventId=existing_event_id, body=body).execute()
-                mapping[summary] = updated["id"]
-                logging.info(f"Updated existing event: {updated.get('htmlLink', 'no link')}")
-            else:
-                # Create new event
-                logging.info(f"Creating new event in calendar: {summary}")
-                body = _build_event_body(pe, msg_id)
-                
-                # Log event details
-                start_time = body.get("start", {}).get("dateTime", "no time")
-                end_time = body.get("end", {}).get("dateTime", "no time")
-                logging.info(f"Event scheduled: {start_time} to {end_time}")
-                
-                created = calendar.events().insert(calendarId=cal_id, body=body).execute()
-                mapping[summary] = created["id"]
-                logging.info(f"Created new event: {created.get('htmlLink', 'no link')}")
-
-    return MessageEventMap(message_id=msg_id, category_to_event_ids=mapping)
+def locate_event_calendars(parsed_event: ParsedEvent, cal_ids: Dict[str, str], state: StateStore, cache: EventWindowCache) -> List[str]:
+    """
+    Find which calendars hold the original event without listing any of them: match against a
+    cross-calendar index of the local mirrors, then expand through the stored refs of the message
+    that created the matched event.
+    """
+    index = cache.cross_calendar_index(cal_ids.values())
+    best = None
+    for entry in index.candidates(parsed_event):
+        score = score_event(parsed_event, entry)
+        if score >= 50 and (best is None or score > best[1]):
+            best = (entry.event_id, score)
+    if best is None:
+        return []
 
-def delete_event_from_calendars(calendar, mapping: MessageEventMap) -> None:
-    # No-op here; deletion would require storing calendar IDs alongside event IDs.
-    pass
\ No newline at end of file
+    cal_id, event_id = cache.split_cross_id(best[0])
+    located = {cal_id}
+    source_msg_id = source_message_id(cache.local_events(cal_id).get(event_id, {}))
+    if source_msg_id:
+        located.update(state.load_event_refs(source_msg_id))
+    return [summary for summary, cid in cal_ids.items() if cid in located]
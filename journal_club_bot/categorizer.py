@@ -1,8 +1,8 @@
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple
 import re
 import logging
-import yaml
 from .models import Categories, CategoryConfig
 
 # Synonym/abbreviation normalization
@@ -45,6 +45,7 @@ STOP_PHRASES = [
 ]
 
 def load_categories(path: Path) -> Categories:
+    import yaml
     with open(path, "r", encoding="utf-8") as f:
         raw = yaml.safe_load(f) or {}
     cats = []
@@ -60,6 +61,19 @@ def load_categories(path: Path) -> Categories:
         fallback_color_id=str(raw.get("fallback_colorId", "1")),
     )
 
+@lru_cache(maxsize=None)
+def _keyword_regex(keyword: str) -> "re.Pattern":
+    # Kept outside the re module's bounded cache, which large keyword lists would churn
+    return re.compile(r'\b' + re.escape(keyword) + r'\b')
+
+def build_category_index(categories: Categories) -> None:
+    """Compile every category keyword and alias pattern ahead of the first categorization"""
+    for abbrev in KEYWORD_ALIASES:
+        _keyword_regex(abbrev)
+    for cat in categories.categories:
+        for keyword in cat.keywords:
+            _keyword_regex(keyword)
+
 def _normalize_text(text: str) -> str:
     """Normalize text for better keyword matching"""
     if not text:
@@ -70,7 +84,7 @@ def _normalize_text(text: str) -> str:
     # Apply alias substitutions for better matching
     for abbrev, full_form in KEYWORD_ALIASES.items():
         # Use word boundaries to avoid partial matches
-        text = re.sub(r'\b' + re.escape(abbrev) + r'\b', full_form, text)
+        text = _keyword_regex(abbrev).sub(full_form, text)
     
     # Remove common hyphen variations (e.g., "single-cell" vs "single cell")
     # Keep the original but add a version without hyphens for matching
@@ -100,9 +114,7 @@ def categorize_text(categories: Categories, text: str) -> List[str]:
         for keyword in cat.keywords:
             # Use word boundaries for better precision
             # But also check for substring matches (for compound terms)
-            keyword_pattern = r'\b' + re.escape(keyword) + r'\b'
-            
-            if re.search(keyword_pattern, normalized_text):
+            if _keyword_regex(keyword).search(normalized_text):
                 # Full word boundary match (highest confidence)
                 score += 10
                 matched_keywords.append(keyword)
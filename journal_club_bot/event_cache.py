@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from .event_index import EventIndex, parse_event_start
+from .executor import execute, http_status
+
+# Recurring events are mirrored as their master plus modified occurrences, not expanded instances.
+# Sync tokens are only valid for the listing parameters they were issued for, so they are keyed by mode.
+SYNC_MODE = "masters"
+
+def _token_key(cal_id: str) -> str:
+    return f"{cal_id}#{SYNC_MODE}"
+
+class EventWindowCache:
+    """
+    Run-scoped cache of each calendar's event window.
+    Each calendar is read at most once per run; mutations made during the run are applied in place.
+    When a StateStore is given, calendars are kept as persistent local mirrors refreshed with
+    incremental sync (events.list(syncToken=...)), so a run only downloads the changes since the last one.
+    A resident worker keeps one cache and calls refresh() before each run.
+    """
+
+    def __init__(self, calendar, state=None, window_days: int = 60) -> None:
+        self.calendar = calendar
+        self.state = state
+        self.window_days = window_days
+        self._events: Dict[str, Dict[str, dict]] = {}
+        # Calendars synced by earlier runs of a resident cache, the base for their next incremental sync
+        self._resident: Dict[str, Dict[str, dict]] = {}
+        self._synced_tokens: Dict[str, Optional[str]] = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Start a new run: move the window to now and re-sync calendars on first use"""
+        now = datetime.now(timezone.utc)
+        self.window_start = now - timedelta(days=self.window_days)
+        self.window_end = now + timedelta(days=self.window_days)
+        self._resident.update(self._events)
+        self._events = {}
+        self._indexes: Dict[str, EventIndex] = {}
+        self._cross_index: Optional[EventIndex] = None
+        self._uids: Dict[str, Dict[str, str]] = {}
+
+    def _list_changes(self, cal_id: str, sync_token: Optional[str]):
+        """Page through events.list; returns (items, next_sync_token)"""
+        items: List[dict] = []
+        page_token = None
+        while True:
+            kwargs = {"calendarId": cal_id, "singleEvents": False, "pageToken": page_token}
+            if sync_token:
+                kwargs["syncToken"] = sync_token
+            resp = execute(self.calendar.events().list(**kwargs), "calendar")
+            items.extend(resp.get('items', []))
+            page_token = resp.get('nextPageToken')
+            if not page_token:
+                return items, resp.get('nextSyncToken')
+
+    def _sync(self, cal_id: str) -> Dict[str, dict]:
+        events: Dict[str, dict] = {}
+        sync_token = None
+        if self.state is not None:
+            sync_token = self.state.load_sync_token(_token_key(cal_id))
+            mirror = self._resident.pop(cal_id, None)
+            if mirror is not None and self._synced_tokens.get(cal_id) != sync_token:
+                mirror = None  # another worker synced the calendar since; its stored mirror is newer
+            if mirror is None and sync_token:
+                mirror = self.state.load_calendar_mirror(cal_id)
+            if mirror is None or not sync_token:
+                sync_token = None
+            else:
+                events = mirror
+
+        try:
+            items, next_token = self._list_changes(cal_id, sync_token)
+        except Exception as e:
+            if not sync_token or http_status(e) != 410:
+                raise
+            # Sync token expired or invalidated by the server: drop the mirror and resync fully
+            logging.info(f"Sync token for calendar {cal_id} is gone, running a full resync")
+            events, sync_token = {}, None
+            items, next_token = self._list_changes(cal_id, None)
+
+        for item in items:
+            if item.get('status') == 'cancelled':
+                events.pop(item['id'], None)
+            else:
+                events[item['id']] = item
+        logging.info(f"{'Incremental' if sync_token else 'Full'} sync of calendar {cal_id}: "
+                     f"{len(items)} changes, {len(events)} events mirrored")
+
+        if self.state is not None:
+            self.state.save_calendar_mirror(cal_id, events)
+            self.state.save_sync_token(_token_key(cal_id), next_token)
+            self._synced_tokens[cal_id] = next_token
+        return events
+
+    def _calendar_events(self, cal_id: str) -> Dict[str, dict]:
+        if cal_id not in self._events:
+            self._events[cal_id] = self._sync(cal_id)
+        return self._events[cal_id]
+
+    def _in_window(self, event: dict) -> bool:
+        start = parse_event_start(event)
+        if start is None:
+            day = event.get('start', {}).get('date')
+            if not day:
+                return False
+            start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=timezone.utc)
+        return self.window_start <= start <= self.window_end
+
+    def events(self, cal_id: str) -> List[dict]:
+        """Events of the calendar within the matching window (+/- window_days around now)"""
+        return [e for e in self._calendar_events(cal_id).values() if self._in_window(e)]
+
+    def index(self, cal_id: str) -> EventIndex:
+        if cal_id not in self._indexes:
+            self._indexes[cal_id] = EventIndex(self.events(cal_id))
+        return self._indexes[cal_id]
+
+    def local_events(self, cal_id: str) -> Dict[str, dict]:
+        """Events known without any API call: this run's synced copy, else the persisted mirror"""
+        if cal_id in self._events:
+            return self._events[cal_id]
+        if cal_id in self._resident:
+            return self._resident[cal_id]
+        if self.state is not None:
+            return self.state.load_calendar_mirror(cal_id) or {}
+        return {}
+
+    def cross_calendar_index(self, cal_ids: Iterable[str]) -> EventIndex:
+        """
+        One index over the windows of several calendars built from local data only.
+        Entry IDs are "<calendar_id>/<event_id>"; see split_cross_id.
+        """
+        if self._cross_index is None:
+            events = []
+            for cal_id in cal_ids:
+                for event in self.local_events(cal_id).values():
+                    if self._in_window(event):
+                        events.append({**event, 'id': f"{cal_id}/{event['id']}"})
+            self._cross_index = EventIndex(events)
+        return self._cross_index
+
+    @staticmethod
+    def split_cross_id(cross_id: str) -> Tuple[str, str]:
+        cal_id, _, event_id = cross_id.rpartition('/')
+        return cal_id, event_id
+
+    def contains(self, cal_id: str, event_id: str) -> bool:
+        """Whether the event exists in the calendar (the mirror covers the whole calendar, not just the window)"""
+        return event_id in self._calendar_events(cal_id)
+
+    def find_by_ical_uid(self, cal_id: str, ical_uid: str) -> Optional[dict]:
+        events = self._calendar_events(cal_id)
+        if cal_id not in self._uids:
+            self._uids[cal_id] = {e['iCalUID']: e['id'] for e in events.values() if e.get('iCalUID')}
+        event_id = self._uids[cal_id].get(ical_uid)
+        return events.get(event_id) if event_id else None
+
+    def get(self, cal_id: str, event_id: str) -> dict:
+        """Return the mirrored event, fetching it directly if it is not mirrored"""
+        events = self._calendar_events(cal_id)
+        if event_id not in events:
+            events[event_id] = execute(self.calendar.events().get(calendarId=cal_id, eventId=event_id), "calendar")
+        return events[event_id]
+
+    def upsert(self, cal_id: str, event: dict) -> None:
+        if cal_id in self._events:
+            self._events[cal_id][event['id']] = event
+        if cal_id in self._indexes:
+            self._indexes[cal_id].add(event)
+        if cal_id in self._uids and event.get('iCalUID'):
+            self._uids[cal_id][event['iCalUID']] = event['id']
+        self._cross_index = None
+
+    def remove(self, cal_id: str, event_id: str) -> None:
+        if cal_id in self._events:
+            self._events[cal_id].pop(event_id, None)
+        if cal_id in self._indexes:
+            self._indexes[cal_id].remove(event_id)
+        self._cross_index = None
@@ -0,0 +1,175 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+from .models import ParsedEvent
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_SPEAKER_LINE_RE = re.compile(r'^speaker:\s*(.+)$', re.MULTILINE)
+
+# Tokens shared by more events than this are too common to drive retrieval on their own
+MAX_POSTING_FRACTION = 0.02
+MIN_MAX_POSTING = 50
+
+def tokenize(text: Optional[str]) -> Set[str]:
+    return set(_TOKEN_RE.findall((text or '').lower()))
+
+def surname(name: Optional[str]) -> Optional[str]:
+    tokens = _TOKEN_RE.findall((name or '').lower())
+    return tokens[-1] if tokens else None
+
+def parse_event_start(event: dict) -> Optional[datetime]:
+    start = event.get('start', {}).get('dateTime')
+    if not start:
+        return None
+    try:
+        return datetime.fromisoformat(start)
+    except ValueError:
+        from dateutil import parser as date_parser
+        try:
+            return date_parser.parse(start)
+        except (ValueError, OverflowError):
+            return None
+
+def day_bucket(dt: datetime) -> int:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.date().toordinal()
+
+@dataclass
+class IndexedEvent:
+    """Calendar event with its matching fields normalized and start time pre-parsed"""
+    event_id: str
+    summary: str
+    summary_lower: str
+    description_lower: str
+    location_lower: str
+    start: Optional[datetime]
+
+class EventIndex:
+    """
+    Inverted index over a calendar's events, keyed by title tokens, speaker surname,
+    location tokens and day buckets, used to retrieve match candidates without a full scan.
+    """
+
+    def __init__(self, events: Iterable[dict] = ()) -> None:
+        self.entries: Dict[str, IndexedEvent] = {}
+        self._title: Dict[str, Set[str]] = {}
+        self._text: Dict[str, Set[str]] = {}
+        self._speaker: Dict[str, Set[str]] = {}
+        self._location: Dict[str, Set[str]] = {}
+        self._days: Dict[int, Set[str]] = {}
+        self._keys: Dict[str, List[tuple]] = {}
+        for event in events:
+            self.add(event)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _post(self, postings: Dict, keys: Iterable, event_id: str) -> None:
+        for key in keys:
+            postings.setdefault(key, set()).add(event_id)
+            self._keys[event_id].append((postings, key))
+
+    def add(self, event: dict) -> None:
+        event_id = event['id']
+        if event_id in self.entries:
+            self.remove(event_id)
+        summary = event.get('summary', '')
+        description = event.get('description', '')
+        location = event.get('location', '')
+        entry = IndexedEvent(
+            event_id=event_id,
+            summary=summary,
+            summary_lower=summary.lower(),
+            description_lower=description.lower(),
+            location_lower=location.lower(),
+            start=parse_event_start(event),
+        )
+        self.entries[event_id] = entry
+        self._keys[event_id] = []
+        self._post(self._title, tokenize(summary), event_id)
+        self._post(self._text, tokenize(description), event_id)
+        self._post(self._location, tokenize(location), event_id)
+        speakers = {surname(m) for m in _SPEAKER_LINE_RE.findall(entry.description_lower)}
+        self._post(self._speaker, {s for s in speakers if s}, event_id)
+        if entry.start:
+            self._post(self._days, [day_bucket(entry.start)], event_id)
+
+    def remove(self, event_id: str) -> None:
+        if self.entries.pop(event_id, None) is None:
+            return
+        for postings, key in self._keys.pop(event_id, []):
+            ids = postings.get(key)
+            if ids is not None:
+                ids.discard(event_id)
+                if not ids:
+                    del postings[key]
+
+    def _near_days(self, dt: datetime, days: int) -> Set[str]:
+        center = day_bucket(dt)
+        ids: Set[str] = set()
+        for bucket in range(center - days, center + days + 1):
+            ids |= self._days.get(bucket, set())
+        return ids
+
+    def _all_of(self, postings: Dict[str, Set[str]], tokens: Set[str]) -> Set[str]:
+        """Events whose field contains every token (necessary for a substring match)"""
+        lists = sorted((postings.get(t, set()) for t in tokens), key=len)
+        if not lists or not lists[0]:
+            return set()
+        ids = set(lists[0])
+        for posting in lists[1:]:
+            ids &= posting
+            if not ids:
+                break
+        return ids
+
+    def candidates(self, pe: ParsedEvent) -> List[IndexedEvent]:
+        """
+        Events that could reach the match threshold: those sharing a distinctive title,
+        reference or speaker token, those containing the whole title or reference, and those
+        sharing enough common words or the location within the date windows where date
+        proximity can make up the rest of the score. Locations match either way round, as in
+        score_event: the event's location holds the parsed one or is held by it.
+        """
+        max_posting = max(MIN_MAX_POSTING, int(len(self.entries) * MAX_POSTING_FRACTION))
+        title_tokens = tokenize(pe.title if pe.title != "Journal Club" else None)
+        ref_tokens = tokenize(pe.original_event_ref)
+        speaker_key = surname(pe.speaker)
+
+        ids: Set[str] = set()
+        common: List[Set[str]] = []
+        for token in title_tokens | ref_tokens:
+            for postings in (self._title, self._text):
+                posting = postings.get(token)
+                if not posting:
+                    continue
+                if len(posting) <= max_posting:
+                    ids |= posting
+                elif postings is self._title and token in title_tokens:
+                    common.append(posting)
+        if speaker_key:
+            ids |= self._speaker.get(speaker_key, set())
+            ids |= self._title.get(speaker_key, set())
+            ids |= self._text.get(speaker_key, set())
+        if title_tokens or ref_tokens:
+            ids |= self._all_of(self._title, title_tokens)
+            ids |= self._all_of(self._title, ref_tokens)
+            ids |= self._all_of(self._text, ref_tokens)
+
+        if pe.start and common:
+            # Three shared words within a week is the weakest title evidence that can still match
+            near = self._near_days(pe.start, 7)
+            counts: Dict[str, int] = {}
+            for posting in common:
+                for event_id in near & posting:
+                    counts[event_id] = counts.get(event_id, 0) + 1
+            ids |= {event_id for event_id, n in counts.items() if n >= 3}
+        if pe.start and pe.location:
+            near = self._near_days(pe.start, 1)
+            location_tokens = tokenize(pe.location)
+            ids |= near & self._all_of(self._location, location_tokens)
+            ids |= {i for i in near if self.entries[i].location_lower and tokenize(self.entries[i].location_lower) <= location_tokens}
+
+        return [self.entries[i] for i in ids]
@@ -0,0 +1,201 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded")
+
+def http_status(error: Exception) -> Optional[int]:
+    resp = getattr(error, "resp", None)
+    return getattr(resp, "status", None)
+
+def timed(timings: Dict[str, float], phase: str, fn: Callable, *args, **kwargs):
+    """Call fn and add its wall time in seconds to timings[phase]"""
+    start = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+def _is_rate_limited(error: Exception) -> bool:
+    status = http_status(error)
+    if status == 429:
+        return True
+    if status == 403:
+        content = getattr(error, "content", b"") or b""
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", errors="replace")
+        return any(reason in content for reason in RATE_LIMIT_REASONS)
+    return False
+
+def is_retryable(error: Exception) -> bool:
+    return http_status(error) in RETRYABLE_STATUSES or _is_rate_limited(error)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    resp = getattr(error, "resp", None)
+    value = resp.get("retry-after") if hasattr(resp, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class TokenBucket:
+    """Thread-safe token bucket for client-side rate limiting"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, units: float = 1) -> None:
+        # A request costing more than the bucket holds waits for a full bucket and overdraws it,
+        # so later requests pay the difference and the average rate still holds
+        needed = min(units, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= units
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+class AIMDController:
+    """
+    Concurrency limit with additive increase / multiplicative decrease:
+    each success grows the limit by 1/limit (about +1 per window), each throttle halves it.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 16) -> None:
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._cond:
+            self.limit = max(self.minimum, self.limit / 2)
+
+class RequestExecutor:
+    """
+    Shared executor for Google API requests: retries 403 rate-limit, 429 and 5xx errors with
+    exponential backoff and full jitter, accounts quota units per API, rate limits each API with
+    a token bucket and adapts per-API concurrency with an AIMD controller.
+    """
+
+    def __init__(self, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 32.0) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._controllers: Dict[str, AIMDController] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, api: str, units_per_second: Optional[float] = None, max_concurrency: Optional[int] = None) -> None:
+        """Set the API's rate and concurrency ceiling; unchanged settings keep their learned state"""
+        with self._lock:
+            bucket = self._buckets.get(api)
+            if units_per_second and (bucket is None or bucket.rate != float(units_per_second)):
+                self._buckets[api] = TokenBucket(units_per_second)
+            controller = self._controllers.get(api)
+            if max_concurrency and (controller is None or controller.maximum != float(max_concurrency)):
+                self._controllers[api] = AIMDController(initial=max(1, max_concurrency // 2), maximum=max_concurrency)
+
+    def controller(self, api: str) -> AIMDController:
+        with self._lock:
+            if api not in self._controllers:
+                self._controllers[api] = AIMDController()
+            return self._controllers[api]
+
+    def _count(self, api: str, key: str, amount: float = 1) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(api, {"requests": 0, "units": 0, "retries": 0, "throttled": 0, "errors": 0})
+            counters[key] = counters.get(key, 0) + amount
+
+    def record(self, api: str, error: Optional[Exception] = None, units: float = 1) -> None:
+        """Account for a call sent inside another request (e.g. one part of a batch)"""
+        self._count(api, "units", units)
+        controller = self.controller(api)
+        if error is None:
+            controller.on_success()
+        elif _is_rate_limited(error):
+            self._count(api, "throttled")
+            controller.on_throttle()
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error) if error is not None else None
+        return max(delay, retry_after or 0)
+
+    def execute(self, request, api: str, units: float = 1, **kwargs):
+        """Execute an HttpRequest with rate limiting, adaptive concurrency and retries"""
+        bucket = self._buckets.get(api)
+        controller = self.controller(api)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire(units)
+            controller.acquire()
+            try:
+                self._count(api, "requests")
+                self._count(api, "units", units)
+                response = request.execute(**kwargs)
+            except Exception as e:
+                if _is_rate_limited(e):
+                    self._count(api, "throttled")
+                    controller.on_throttle()
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    self._count(api, "errors")
+                    raise
+                error = e
+            else:
+                controller.on_success()
+                return response
+            finally:
+                controller.release()
+
+            delay = self.backoff(attempt, error)
+            attempt += 1
+            self._count(api, "retries")
+            logging.warning(f"{api} request failed ({http_status(error)}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {api: dict(counters) for api, counters in self._counters.items()}
+        for api, controller in self._controllers.items():
+            snapshot.setdefault(api, {})["concurrency_limit"] = round(controller.limit, 2)
+        return snapshot
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._counters = {}
+
+EXECUTOR = RequestExecutor()
+
+def execute(request, api: str, units: float = 1, **kwargs):
+    return EXECUTOR.execute(request, api, units, **kwargs)
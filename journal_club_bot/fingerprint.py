@@ -0,0 +1,88 @@
+import hashlib
+import re
+from typing import Dict, Optional
+from .models import MessageFingerprint
+
+SIMHASH_BITS = 64
+
+_URL_RE = re.compile(r'https?://\S+|www\.\S+', re.IGNORECASE)
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+# Bracketed status words change what a message means, so only list-name tags are stripped
+_STATUS_TAG = r'(?:cancel+ed|cancell?ation|updated?|rescheduled|postponed|changed?|correction|reminder|moved|new\b)'
+_LIST_TAG_RE = re.compile(
+    r'^\s*(?:\[(?!\s*' + _STATUS_TAG + r')[^\]]*\]\s*|(?:re|fw|fwd)\s*:\s*)+',
+    re.IGNORECASE,
+)
+_FOOTER_RE = re.compile(
+    r'^\s*(?:--\s*$|_{5,}|-{5,}\s*$|.*\bunsubscribe\b|.*\byou (?:are )?receiv(?:ed|ing) this\b|.*\bmailing list\b)',
+    re.IGNORECASE | re.MULTILINE,
+)
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_NUMBER_RE = re.compile(r'\d+')
+
+def _normalize(subject: str, body_text: str) -> str:
+    """Strip list tags, footers, links and addresses that differ between cross-posted copies"""
+    subject = _LIST_TAG_RE.sub('', subject or '')
+    body_text = body_text or ''
+    footer = _FOOTER_RE.search(body_text)
+    if footer and footer.start() > 0:
+        body_text = body_text[:footer.start()]
+    text = f"{subject}\n{body_text}"
+    text = _URL_RE.sub(' ', text)
+    text = _EMAIL_RE.sub(' ', text)
+    return text.lower()
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash over word shingles"""
+    words = _WORD_RE.findall(text)
+    if not words:
+        return 0
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        h = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+def fingerprint_message(subject: str, body_text: str, email_type: str = "new") -> MessageFingerprint:
+    """
+    Fingerprint a message body for near-duplicate detection.
+    Numbers (dates, times, rooms) and the email type are hashed separately and must match
+    exactly, so that templated weekly announcements that differ only in date or room, and
+    updates or cancellations of an announcement, are never merged with it.
+    """
+    text = _normalize(subject, body_text)
+    numbers = sorted(set(_NUMBER_RE.findall(text)))
+    exact = f"{email_type}|{' '.join(numbers)}"
+    numbers_digest = hashlib.blake2b(exact.encode("utf-8"), digest_size=8).hexdigest()
+    return MessageFingerprint(simhash=simhash(text), numbers=numbers_digest)
+
+def find_near_duplicate(fp: MessageFingerprint, known: Dict[str, MessageFingerprint], threshold: int) -> Optional[str]:
+    """Return the message ID of the closest known fingerprint within the Hamming threshold"""
+    best_id = None
+    best_distance = threshold + 1
+    for message_id, other in known.items():
+        if other.numbers != fp.numbers:
+            continue
+        distance = hamming_distance(fp.simhash, other.simhash)
+        if distance < best_distance:
+            best_id, best_distance = message_id, distance
+            if distance == 0:
+                break
+    return best_id
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .storage import StateStore, _write_json_atomic, merge_changes
+
+# Per-instance caches: mirrors and sync tokens are rebuilt by a full sync, the Bloom filter from the
+# archive; the poller heartbeat describes this instance only
+LOCAL_ONLY = ("mirrors/", "sync_tokens.json", "pruned.bloom.json", ".gcs_state.json", "heartbeat.json")
+MAX_PUSH_ATTEMPTS = 5
+
+def _storage_client():
+    from google.cloud import storage
+    if os.environ.get("STORAGE_EMULATOR_HOST"):
+        # Local fake GCS server (e.g. fake-gcs-server); the client library routes requests there
+        from google.auth.credentials import AnonymousCredentials
+        return storage.Client(project=os.environ.get("GOOGLE_CLOUD_PROJECT", "test"), credentials=AnonymousCredentials())
+    return storage.Client()
+
+class GCSStateStore(StateStore):
+    """
+    JSON StateStore whose files are kept in one GCS object, so state survives ephemeral
+    container disks. The local state directory is a read-through cache revalidated by object
+    generation; writes are uploaded with ifGenerationMatch and, when another instance wrote
+    in between, merged key by key with the newer object and retried.
+    """
+
+    def __init__(self, base_dir: str, bucket: str, object_name: str) -> None:
+        self.bucket_name = bucket
+        self.object_name = object_name
+        super().__init__(base_dir)
+
+    def _initialize(self) -> None:
+        self._blob = _storage_client().bucket(self.bucket_name).blob(self.object_name)
+        self._sync_meta_path = self.base / ".gcs_state.json"
+        self._generation = 0
+        self._snapshot: Dict[str, object] = {}
+        self._unpushed: Set[str] = set()
+        self._claims: Dict[str, int] = {}
+        self._pull()
+        super()._initialize()
+        if self._unpushed:
+            self._push()
+
+    def _rel(self, path: Path) -> str:
+        return path.relative_to(self.base).as_posix()
+
+    def _synced(self, rel: str) -> bool:
+        return not rel.startswith(LOCAL_ONLY)
+
+    def _local_bundle(self) -> Dict[str, object]:
+        bundle = {}
+        for path in sorted(self.base.rglob("*.json")):
+            rel = self._rel(path)
+            if self._synced(rel):
+                bundle[rel] = self._read(path)
+        return bundle
+
+    def _download(self) -> Tuple[int, Dict[str, object]]:
+        blob = self._blob.bucket.get_blob(self.object_name)
+        if blob is None:
+            return 0, {}
+        data = blob.download_as_bytes(if_generation_match=blob.generation)
+        return blob.generation, json.loads(data)
+
+    def _apply_remote(self, rel: str, data) -> None:
+        path = self.base / rel
+        if data is None:
+            if path.exists():
+                path.unlink()
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _write_json_atomic(path, data, indent=None if rel.startswith("archive/") else 2)
+        if self._session is not None:
+            self._session.pop(path, None)
+
+    def _pull(self) -> None:
+        """Refresh the local copy if the object changed since this instance last saw it"""
+        known = json.loads(self._sync_meta_path.read_text(encoding="utf-8")).get("generation", 0) if self._sync_meta_path.exists() else 0
+        blob = self._blob.bucket.get_blob(self.object_name)
+        if blob is None or blob.generation == known:
+            self._generation = blob.generation if blob is not None else 0
+            self._snapshot = self._local_bundle()
+            return
+        generation, remote = self._download()
+        for rel in set(remote) | set(self._local_bundle()):
+            self._apply_remote(rel, remote.get(rel))
+        self._generation, self._snapshot = generation, remote
+        self._save_sync_meta()
+        if self.archive_dir.exists() and not self.bloom_path.exists():
+            _write_json_atomic(self.bloom_path, self._load_bloom(0).to_dict(), indent=None)
+        self._bloom, self._archived = None, None
+        logging.info(f"Loaded state from gs://{self.bucket_name}/{self.object_name} (generation {generation})")
+
+    def _save_sync_meta(self) -> None:
+        _write_json_atomic(self._sync_meta_path, {"generation": self._generation})
+
+    def _merge_remote(self) -> None:
+        generation, remote = self._download()
+        local = self._local_bundle()
+        for rel in set(remote) | set(local):
+            if rel in self._unpushed:
+                merged = merge_changes(self._snapshot.get(rel), local.get(rel), remote.get(rel))
+            else:
+                merged = remote.get(rel)
+            self._apply_remote(rel, merged)
+        self._generation, self._snapshot = generation, remote
+
+    def _push(self) -> None:
+        from google.api_core.exceptions import PreconditionFailed
+        for attempt in range(MAX_PUSH_ATTEMPTS):
+            bundle = self._local_bundle()
+            try:
+                self._blob.upload_from_string(
+                    json.dumps(bundle, separators=(",", ":")),
+                    content_type="application/json",
+                    if_generation_match=self._generation,
+                )
+            except PreconditionFailed:
+                logging.info(f"State object changed since generation {self._generation}, merging and retrying")
+                self._merge_remote()
+                continue
+            self._generation, self._snapshot = self._blob.generation, bundle
+            self._unpushed.clear()
+            self._save_sync_meta()
+            return
+        raise RuntimeError(f"Could not save state to gs://{self.bucket_name}/{self.object_name} after {MAX_PUSH_ATTEMPTS} attempts")
+
+    def _write(self, path: Path, data, indent=2) -> None:
+        rel = self._rel(path)
+        super()._write(path, data, indent)
+        if self._synced(rel):
+            self._unpushed.add(rel)
+            if self._session is None:
+                self._push()
+
+    def _claim_blob(self, message_id: str):
+        return self._blob.bucket.blob(f"{self.object_name}.claims/{message_id}")
+
+    def claim(self, message_ids: Iterable[str], owner: str, lease_seconds: float, limit: Optional[int] = None) -> List[str]:
+        """
+        Lease messages through one small object per message: created with ifGenerationMatch=0,
+        or taken over with a generation match once the previous lease has expired. Leases are
+        deleted once their messages are processed, so a new lease is checked against the newest
+        state object before it is handed out; expired leases left behind by crashed workers are
+        deleted on the way.
+        """
+        self._sweep_leases(lease_seconds)
+        pending = iter(message_ids)
+        claimed: List[str] = []
+        while limit is None or len(claimed) < limit:
+            batch = self._claim_some(pending, owner, lease_seconds, None if limit is None else limit - len(claimed))
+            if not batch:
+                break
+            done = self._processed_remotely() & set(batch)
+            if done:
+                self.release(done, owner)
+            claimed += [m for m in batch if m not in done]
+        return claimed
+
+    def _claim_some(self, pending: Iterator[str], owner: str, lease_seconds: float, limit: Optional[int]) -> List[str]:
+        from google.api_core.exceptions import PreconditionFailed
+        claimed = []
+        while limit is None or len(claimed) < limit:
+            message_id = next(pending, None)
+            if message_id is None:
+                break
+            if self.is_processed(message_id):
+                continue
+            blob = self._claim_blob(message_id)
+            expires = time.time() + lease_seconds
+            blob.metadata = {"expires": str(expires)}
+            lease = json.dumps({"owner": owner, "expires": expires})
+            try:
+                blob.upload_from_string(lease, content_type="application/json", if_generation_match=0)
+            except PreconditionFailed:
+                current = self._blob.bucket.get_blob(blob.name)
+                if current is None:
+                    continue
+                held = json.loads(current.download_as_bytes())
+                if held["owner"] != owner and held["expires"] > time.time():
+                    continue
+                try:
+                    blob.upload_from_string(lease, content_type="application/json", if_generation_match=current.generation)
+                except PreconditionFailed:
+                    continue
+            self._claims[message_id] = blob.generation
+            claimed.append(message_id)
+        return claimed
+
+    def _processed_remotely(self) -> Set[str]:
+        """Message IDs processed in the newest state object, if another instance wrote it since this one synced"""
+        blob = self._blob.bucket.get_blob(self.object_name)
+        if blob is None or blob.generation == self._generation:
+            return set()
+        _, remote = self._download()
+        return set(remote.get("processed.json") or {})
+
+    def _sweep_leases(self, lease_seconds: float) -> None:
+        """Delete expired lease objects; leases written without expiry metadata age from their last update"""
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        now = time.time()
+        for blob in self._blob.bucket.list_blobs(prefix=f"{self.object_name}.claims/"):
+            expires = (blob.metadata or {}).get("expires")
+            expires = float(expires) if expires else blob.updated.timestamp() + lease_seconds
+            if expires > now:
+                continue
+            try:
+                blob.delete(if_generation_match=blob.generation)
+            except (NotFound, PreconditionFailed):
+                pass
+
+    def release(self, message_ids: Iterable[str], owner: str) -> None:
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        for message_id in message_ids:
+            generation = self._claims.pop(message_id, None)
+            if generation is None:
+                continue
+            try:
+                # Only delete the lease this instance wrote
+                self._claim_blob(message_id).delete(if_generation_match=generation)
+            except (NotFound, PreconditionFailed):
+                pass
+
+    @contextmanager
+    def session(self):
+        self._pull()
+        with super().session():
+            yield self
+
+    def flush(self) -> None:
+        super().flush()
+        if self._unpushed:
+            self._push()
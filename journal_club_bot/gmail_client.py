@@ -1,12 +1,22 @@
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from email.header import decode_header
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Tuple, Optional, Dict, Any
+from typing import List, Tuple, Optional, Dict, Any, Iterable, Iterator
 import os
-import yaml
+import threading
+from .executor import EXECUTOR, execute
+
+# Gmail per-user quota: 250 units/second; messages.get and messages.list cost 5 units each
+GMAIL_QUOTA_UNITS_PER_SECOND = 250
+MESSAGES_GET_UNITS = 5
+MESSAGES_LIST_UNITS = 5
+
+MessagePayload = Tuple[str, str, Optional[str], List[Dict[str, str]]]
 
 def _load_settings(settings_path: Path) -> dict:
+    import yaml
     with open(settings_path, "r", encoding="utf-8") as f:
         cfg = yaml.safe_load(f) or {}
     if os.environ.get("JC_TIMEZONE"):
@@ -34,7 +44,7 @@ def fetch_labeled_messages(gmail, settings_path: Path, state) -> List[Dict[str,
     logging.info(f"Gmail query: {query}")
     logging.info(f"Searching for label: {source_label}, lookback_days: {lookback_days}")
     
-    results = gmail.users().messages().list(userId="me", q=query, maxResults=max_messages).execute()
+    results = execute(gmail.users().messages().list(userId="me", q=query, maxResults=max_messages), "gmail", units=MESSAGES_LIST_UNITS)
     messages = results.get("messages", [])
     logging.info(f"Found {len(messages)} messages")
     return messages
@@ -48,8 +58,11 @@ def _decode_subject(headers: List[Dict[str, str]]) -> str:
         out += text.decode(enc or "utf-8", errors="replace") if isinstance(text, bytes) else text
     return out
 
-def extract_message_payload(gmail, message_id: str) -> Tuple[str, str, Optional[str], List[Dict[str, str]]]:
-    msg = gmail.users().messages().get(userId="me", id=message_id, format="full").execute()
+def extract_message_payload(gmail, message_id: str) -> MessagePayload:
+    msg = execute(gmail.users().messages().get(userId="me", id=message_id, format="full"), "gmail", units=MESSAGES_GET_UNITS)
+    return _payload_from_message(msg)
+
+def _payload_from_message(msg: Dict[str, Any]) -> MessagePayload:
     headers = msg["payload"].get("headers", [])
     subject = _decode_subject(headers)
 
@@ -84,4 +97,60 @@ def extract_message_payload(gmail, message_id: str) -> Tuple[str, str, Optional[
                 walk_parts(p)
 
     walk_parts(msg["payload"])
-    return subject, body_text, html, attachments
\ No newline at end of file
+    return subject, body_text, html, attachments
+
+_thread_local = threading.local()
+
+# Fetch threads live as long as the process, so their HTTP connections are reused across runs
+_fetch_pool: Optional[ThreadPoolExecutor] = None
+_fetch_pool_workers = 0
+_fetch_pool_lock = threading.Lock()
+
+def _thread_http(gmail):
+    """Per-thread authorized HTTP object; the service's shared httplib2 instance is not thread-safe"""
+    credentials = getattr(gmail._http, "credentials", None)
+    cached = getattr(_thread_local, "http", None)
+    if cached is not None and cached[0] is credentials:
+        return cached[1]
+    import httplib2
+    import google_auth_httplib2
+    if credentials is not None:
+        http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+    else:
+        from googleapiclient.http import build_http
+        http = build_http()
+    _thread_local.http = (credentials, http)
+    return http
+
+def _get_fetch_pool(workers: int) -> ThreadPoolExecutor:
+    """The process-wide fetch pool, rebuilt only when fetch_workers changes"""
+    global _fetch_pool, _fetch_pool_workers
+    with _fetch_pool_lock:
+        if _fetch_pool is None or _fetch_pool_workers != workers:
+            if _fetch_pool is not None:
+                _fetch_pool.shutdown(wait=False)
+            _fetch_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail-fetch")
+            _fetch_pool_workers = workers
+        return _fetch_pool
+
+def iter_message_payloads(gmail, message_ids: Iterable[str], settings_path: Path) -> Iterator[Tuple[str, MessagePayload]]:
+    """
+    Fetch messages on a bounded thread pool, rate limited to the Gmail per-user quota.
+    The executor's AIMD controller adapts how many of the workers may be in flight at once.
+    Payloads are yielded in the order the IDs were given, as soon as each one is available.
+    """
+    cfg = _load_settings(settings_path)
+    workers = max(1, int(cfg.get("fetch_workers", 8)))
+    EXECUTOR.configure(
+        "gmail",
+        units_per_second=float(cfg.get("gmail_quota_units_per_second", GMAIL_QUOTA_UNITS_PER_SECOND)),
+        max_concurrency=workers,
+    )
+    message_ids = list(message_ids)
+
+    def fetch(message_id: str) -> Tuple[str, MessagePayload]:
+        request = gmail.users().messages().get(userId="me", id=message_id, format="full")
+        msg = execute(request, "gmail", units=MESSAGES_GET_UNITS, http=_thread_http(gmail))
+        return message_id, _payload_from_message(msg)
+
+    yield from _get_fetch_pool(workers).map(fetch, message_ids)
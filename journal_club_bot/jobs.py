@@ -0,0 +1,63 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Finished jobs kept for GET /runs/<id>
+MAX_FINISHED_JOBS = 50
+
+class RunJobs:
+    """
+    Single-flight background runner. submit() starts a job on one worker thread and returns its
+    ID at once; a trigger that arrives while a job is queued or running joins that job instead
+    of starting another one.
+    """
+
+    def __init__(self, target: Callable[[], Any]) -> None:
+        self._target = target
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._active: Optional[str] = None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="run-job")
+        self._lock = threading.Lock()
+
+    def submit(self) -> Tuple[Dict[str, Any], bool]:
+        """Return (job, coalesced): the job that will cover this trigger and whether it was already in flight"""
+        with self._lock:
+            if self._active is not None:
+                job = self._jobs[self._active]
+                job["triggers"] += 1
+                return dict(job), True
+            job_id = uuid.uuid4().hex
+            job = {"id": job_id, "status": "queued", "triggers": 1, "queued_at": time.time(),
+                   "started_at": None, "finished_at": None, "result": None, "error": None}
+            self._jobs[job_id] = job
+            self._active = job_id
+            self._trim()
+        self._pool.submit(self._run, job_id)
+        return dict(job), False
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"], job["started_at"] = "running", time.time()
+        try:
+            result, status, error = self._target(), "succeeded", None
+        except Exception as e:
+            logging.exception(f"Run {job_id} failed")
+            result, status, error = None, "failed", f"{type(e).__name__}: {e}"
+        with self._lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time())
+            self._active = None
+
+    def _trim(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
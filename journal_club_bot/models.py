@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Optional, Dict, List
 from datetime import datetime
 
@@ -37,4 +37,34 @@ class Categories:
 @dataclass
 class MessageEventMap:
     message_id: str
-    category_to_event_ids: Dict[str, str]
\ No newline at end of file
+    category_to_event_ids: Dict[str, str]
+    failed_categories: List[str] = field(default_factory=list)
+    event_end: Optional[datetime] = None  # Keeps the entry past the lookback window until the event is over
+
+@dataclass
+class MessageFingerprint:
+    simhash: int
+    numbers: str
+
+@dataclass
+class ParsedMessage:
+    message_id: str
+    subject: str
+    event: Optional[ParsedEvent]
+
+@dataclass
+class PlannedOperation:
+    kind: str  # "create", "patch", "delete", "noop"
+    cal_id: str
+    calendar_summary: str
+    title: str
+    message_ids: List[str]
+    event_id: Optional[str] = None
+    body: Optional[dict] = None
+    existing: Optional[dict] = None
+    series_slot: Optional[str] = None  # Set when creating or re-bounding the recurring event of a weekly slot
+
+@dataclass
+class ReconciliationPlan:
+    operations: List[PlannedOperation]
+    message_ids: List[str]
@@ -1,11 +1,9 @@
 import re
 import logging
+from functools import lru_cache
 from datetime import timedelta, datetime
 from typing import Optional, Tuple, List, Dict, Any
-import dateparser
-from bs4 import BeautifulSoup
 from pathlib import Path
-import yaml
 from .models import ParsedEvent
 
 # Common academic/research keywords for scoring
@@ -21,13 +19,26 @@ ACADEMIC_KEYWORDS = [
     'virus', 'bacteria', 'immune', 'cancer', 'tumor', 'metabolism', 'gene'
 ]
 
+# Representative announcement used to warm the parser before the first real message
+WARM_UP_SUBJECT = "Journal Club: Neural circuit dynamics in cortex"
+WARM_UP_HTML = (
+    "<p><b>Speaker:</b> Dr. Jane Doe</p>"
+    "<p><b>Date:</b> Wednesday, September 24, 2025 10:00 AM</p>"
+    "<p><b>Location:</b> Room 101, Life Sciences Building</p>"
+    "<p>Abstract: We characterize the mechanism of signaling pathways. https://example.org/paper</p>"
+)
+
 def _load_settings(settings_path: Path) -> dict:
+    import yaml
     with open(settings_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f) or {}
 
+# The near-duplicate gate and the parser read the same message's HTML back to back
+@lru_cache(maxsize=16)
 def _html_to_text(html: Optional[str]) -> str:
     if not html:
         return ""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html, "lxml")
     return soup.get_text("\n", strip=True)
 
@@ -142,6 +153,7 @@ def _extract_title(text: str, subject: str, html: Optional[str] = None) -> str:
     # Parse HTML for better structure detection
     soup = None
     if html:
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html, 'lxml')
     
     # === STRATEGY 1: Quoted Text (Score: 100) ===
@@ -472,6 +484,7 @@ def _clean_location_text(location: str) -> str:
 
 def _extract_date(text: str, tz: str) -> Optional[datetime]:
     """Extract date information only (no time) from text"""
+    import dateparser
     
     # Split text into lines and focus on content lines (not email headers)
     lines = text.split('\n')
@@ -548,6 +561,7 @@ def _extract_date(text: str, tz: str) -> Optional[datetime]:
 
 def _extract_time(text: str, tz: str) -> Optional[datetime]:
     """Extract time information only (no date) from text"""
+    import dateparser
     
     # Split text into lines and focus on content lines (not email headers)
     lines = text.split('\n')
@@ -722,6 +736,14 @@ def _detect_update_type(text: str) -> str:
     # Default to new if no specific pattern matches
     return "new"
 
+def email_text(subject: str, body_text: Optional[str], html: Optional[str]) -> str:
+    """Text of a message as the parser reads it: subject, plain-text body and the text of the HTML part"""
+    return "\n".join([subject or "", body_text or "", _html_to_text(html) or ""]).strip()
+
+def detect_email_type(subject: str, body_text: Optional[str], html: Optional[str] = None) -> str:
+    """Email type ("new", "update", "cancellation", "reminder") of a message before it is fully parsed"""
+    return _detect_update_type(_clean_email_content(email_text(subject, body_text, html)))
+
 def _extract_original_event_identifier(text: str) -> Optional[str]:
     """
     Extract information that can help identify the original event for updates.
@@ -888,12 +910,13 @@ def _clean_email_content(text: str) -> str:
     return cleaned.strip()
 
 def parse_event_from_text(subject: str, body_text: str, html: Optional[str], settings_path: Path, attachments: Optional[List[Dict[str, str]]] = None) -> Optional[ParsedEvent]:
+    import dateparser
     cfg = _load_settings(settings_path)
     tz = cfg.get("timezone", "America/Los_Angeles")
     default_minutes = int(cfg.get("default_duration_minutes", 60))
 
     # Clean the email content to remove forwarding headers
-    raw_content = "\n".join([subject, body_text or "", _html_to_text(html) or ""]).strip()
+    raw_content = email_text(subject, body_text, html)
     combined = _clean_email_content(raw_content)
     
     if not combined:
@@ -998,4 +1021,17 @@ def parse_event_from_text(subject: str, body_text: str, html: Optional[str], set
         attachments=processed_attachments if processed_attachments else None,
         email_type=email_type,
         original_event_ref=original_event_ref,
-    )
\ No newline at end of file
+    )
+
+_warmed = False
+
+def warm_up(settings_path: Path) -> None:
+    """
+    Parse a sample announcement so the first real message does not pay for compiling the
+    extraction regexes, dateparser's language data and the lxml parser. Runs once per process.
+    """
+    global _warmed
+    if _warmed:
+        return
+    _warmed = True
+    parse_event_from_text(WARM_UP_SUBJECT, "", WARM_UP_HTML, settings_path)
@@ -0,0 +1,381 @@
+import dataclasses
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from .batch import CalendarBatch
+from .calendar_client import (
+    build_event_body,
+    calendar_summary_for_category,
+    canonical_event_key,
+    changed_fields,
+    find_existing_event,
+    locate_event_calendars,
+    score_event,
+    source_message_id,
+    with_content_hash,
+)
+from .categorizer import categorize_text
+from .event_cache import EventWindowCache
+from .event_index import EventIndex
+from .executor import execute, http_status
+from .models import (
+    Categories,
+    MessageEventMap,
+    ParsedEvent,
+    ParsedMessage,
+    PlannedOperation,
+    ReconciliationPlan,
+)
+from .recurrence import (
+    bot_occurrences,
+    event_slot_key,
+    instance_event_id,
+    is_weekly,
+    series_body,
+    series_event_id,
+    series_overrides,
+    series_recurrence,
+)
+from .storage import StateStore
+
+UPDATE_TYPES = ("update", "cancellation", "reminder")
+
+@dataclass
+class _DesiredEvent:
+    key: str
+    event: ParsedEvent
+    message_ids: List[str]
+    summaries: List[str]
+    cancelled: bool = False
+
+    @property
+    def ical_uid(self) -> str:
+        return f"jc-{self.key}@journal-club-bot"
+
+def _merge_update(original: ParsedEvent, update: ParsedEvent) -> ParsedEvent:
+    """Apply an update email on top of an event announced earlier in the same run"""
+    return dataclasses.replace(
+        original,
+        title=update.title if update.title and update.title != "Journal Club" else original.title,
+        start=update.start,
+        end=update.end,
+        speaker=update.speaker or original.speaker,
+        location=update.location or original.location,
+        url=update.url or original.url,
+        abstract=update.abstract or original.abstract,
+        attachments=update.attachments or original.attachments,
+    )
+
+def _match_desired(pe: ParsedEvent, desired: Dict[str, _DesiredEvent]) -> Optional[_DesiredEvent]:
+    """Fuzzy-match an update email against the events announced earlier in this run"""
+    if not desired:
+        return None
+    index = EventIndex(
+        {
+            "id": d.key,
+            "summary": d.event.title,
+            "description": build_event_body(d.event, "")["description"],
+            "location": d.event.location or "",
+            "start": {"dateTime": d.event.start.isoformat()},
+        }
+        for d in desired.values()
+    )
+    best = None
+    for entry in index.candidates(pe):
+        score = score_event(pe, entry)
+        if score >= 50 and (best is None or score > best[1]):
+            best = (entry.event_id, score)
+    return desired[best[0]] if best else None
+
+class _PlanBuilder:
+    """Collects operations keyed by target event, so later messages supersede earlier ones"""
+
+    def __init__(self, state: StateStore, cache: EventWindowCache, tz: str, series_min_occurrences: int) -> None:
+        self.state = state
+        self.cache = cache
+        self.tz = tz
+        self.series_min_occurrences = series_min_occurrences
+        # A copy: series planned in this run are only recorded once their recurring event is created
+        self.series = dict(state.load_series())
+        self.ops: Dict[Tuple[str, str], PlannedOperation] = {}
+        # Slot -> series touched by this run: its calendar, first event if new, announced occurrence starts
+        self._series_runs: Dict[str, dict] = {}
+        self._occurrences: Dict[str, Dict[str, List[datetime]]] = {}
+
+    def existing_event(self, cal_id: str, message_ids: List[str], ical_uid: str) -> Optional[dict]:
+        for msg_id in reversed(message_ids):
+            event_id = self.state.load_event_refs(msg_id).get(cal_id)
+            if event_id and self.cache.contains(cal_id, event_id):
+                return self.cache.get(cal_id, event_id)
+        return self.cache.find_by_ical_uid(cal_id, ical_uid)
+
+    def series_instance(self, cal_id: str, summary: str, pe: ParsedEvent) -> Optional[str]:
+        """
+        Event ID of pe's occurrence in the recurring event of its weekly slot, or None if the slot
+        is not a series. A slot whose recent single events have become weekly gets its recurring
+        event planned here, starting at pe.
+        """
+        if self.series_min_occurrences < 2:
+            return None
+        slot = event_slot_key(cal_id, pe, self.tz)
+        series = self.series.get(slot)
+        if series is None:
+            if cal_id not in self._occurrences:
+                self._occurrences[cal_id] = bot_occurrences(self.cache.local_events(cal_id), cal_id, self.tz)
+            starts = self._occurrences[cal_id].setdefault(slot, [])
+            starts.append(pe.start)
+            if not is_weekly(starts, self.series_min_occurrences):
+                return None
+            series = {"cal_id": cal_id, "event_id": series_event_id(slot), "start": pe.start.isoformat()}
+            self.series[slot] = series
+            logging.info(f"Weekly series detected in {summary} ({slot}), planning a recurring event")
+            self._series_runs[slot] = {"cal_id": cal_id, "summary": summary, "first": pe, "announced": []}
+        elif pe.start < datetime.fromisoformat(series["start"]):
+            return None
+        elif slot not in self._series_runs:
+            announced = series_overrides(self.cache.local_events(cal_id), series["event_id"])
+            self._series_runs[slot] = {"cal_id": cal_id, "summary": summary, "first": None, "announced": announced}
+        self._series_runs[slot]["announced"].append(pe.start)
+        return instance_event_id(series["event_id"], pe.start, self.tz)
+
+    def plan_series(self) -> None:
+        """
+        Create or re-bound the recurring event of every series this run adds occurrences to: it
+        ends at the last announced occurrence and skips the weeks nothing was announced for.
+        """
+        for slot, run in self._series_runs.items():
+            series, cal_id, summary = self.series[slot], run["cal_id"], run["summary"]
+            event_id = series["event_id"]
+            recurrence = series_recurrence(datetime.fromisoformat(series["start"]), run["announced"], self.tz)
+            if run["first"] is not None:
+                body = {**series_body(run["first"], summary, recurrence), "id": event_id}
+                self.put(event_id, PlannedOperation("create", cal_id, summary, summary, [], event_id, body, series_slot=slot))
+                continue
+            master = self.cache.get(cal_id, event_id) if self.cache.contains(cal_id, event_id) else None
+            if master is None:
+                logging.warning(f"Recurring event {event_id} of {slot} is missing from {summary}")
+            elif master.get("recurrence") != recurrence:
+                self.put(event_id, PlannedOperation("patch", cal_id, summary, summary, [], event_id, {"recurrence": recurrence}, master, series_slot=slot))
+
+    def put(self, target: str, op: PlannedOperation) -> None:
+        key = (op.cal_id, target)
+        previous = self.ops.get(key)
+        if previous is not None:
+            op.message_ids = previous.message_ids + [m for m in op.message_ids if m not in previous.message_ids]
+        self.ops[key] = op
+
+    def finalize(self) -> List[PlannedOperation]:
+        """Turn full desired bodies into minimal writes: content-hash no-ops and changed-field patches"""
+        self.plan_series()
+        operations = []
+        for op in self.ops.values():
+            if op.kind == "patch" and op.series_slot:
+                pass  # Only the recurrence of a series is rewritten
+            elif op.kind == "patch":
+                body = with_content_hash(op.body)
+                existing_hash = op.existing.get("extendedProperties", {}).get("private", {}).get("content_hash")
+                patch = changed_fields(op.existing, body)
+                # Events written before hashing, or with a stale hash, may still hold the same content
+                if existing_hash == body["extendedProperties"]["private"]["content_hash"] or patch.keys() == {"extendedProperties"}:
+                    op.kind, op.body = "noop", None
+                else:
+                    op.body = patch
+            elif op.kind == "create":
+                op.body = with_content_hash(op.body)
+            operations.append(op)
+        return operations
+
+def plan_run(messages: List[ParsedMessage], categories: Categories, cal_map: Dict[str, str], state: StateStore, cache: EventWindowCache) -> ReconciliationPlan:
+    """
+    Reconcile all parsed messages of a run against the cached calendar state.
+    Messages are applied oldest first (Gmail lists newest first): announcements of the same talk
+    collapse into one desired event, updates and cancellations are folded into events announced
+    in the same run, and the rest are matched against existing calendar events. The result is
+    the minimal set of create, patch, delete and no-op operations.
+    """
+    cfg = state.load_settings()
+    prefix = cfg.get("calendar_prefix", "Journal Club – ")
+    all_summaries = [calendar_summary_for_category(prefix, cat.name) for cat in categories.categories]
+    if categories.fallback_category:
+        all_summaries.append(calendar_summary_for_category(prefix, categories.fallback_category))
+
+    desired: Dict[str, _DesiredEvent] = {}
+    updates: List[Tuple[str, ParsedEvent]] = []
+
+    for msg in reversed(messages):
+        pe = msg.event
+        if pe is None:
+            continue
+        key = canonical_event_key(pe)
+
+        if pe.email_type not in UPDATE_TYPES:
+            combined_text = f"{msg.subject}\n\n{pe.title}\n\n{pe.abstract or ''}"
+            category_names = categorize_text(categories, combined_text)
+            if not category_names and categories.fallback_category:
+                category_names = [categories.fallback_category]
+            summaries = [calendar_summary_for_category(prefix, c) for c in category_names]
+            d = desired.get(key)
+            if d is None:
+                desired[key] = _DesiredEvent(key=key, event=pe, message_ids=[msg.message_id], summaries=summaries, cancelled=pe.cancelled)
+            else:
+                logging.info(f"Message {msg.message_id} announces '{pe.title}' again in this run")
+                d.event = pe
+                d.message_ids.append(msg.message_id)
+                d.summaries += [s for s in summaries if s not in d.summaries]
+                d.cancelled = pe.cancelled
+            continue
+
+        d = desired.get(key) or _match_desired(pe, desired)
+        if d is not None:
+            logging.info(f"Folding {pe.email_type} {msg.message_id} into '{d.event.title}' announced in this run")
+            d.message_ids.append(msg.message_id)
+            if pe.email_type == "cancellation":
+                d.cancelled = True
+            else:
+                d.event = _merge_update(d.event, pe)
+        else:
+            updates.append((msg.message_id, pe))
+
+    builder = _PlanBuilder(state, cache, cfg.get("timezone", "America/Los_Angeles"), int(cfg.get("recurring_series_min_occurrences", 3)))
+
+    # Earliest first, so a newly detected series starts at its first announced occurrence
+    for d in sorted(desired.values(), key=lambda d: d.event.start):
+        body = build_event_body(d.event, d.message_ids[-1])
+        for summary in d.summaries:
+            cal_id = cal_map.get(summary)
+            if not cal_id:
+                logging.warning("Missing calendar for %s", summary)
+                continue
+            existing = builder.existing_event(cal_id, d.message_ids, d.ical_uid)
+            if d.cancelled:
+                if existing:
+                    builder.put(existing["id"], PlannedOperation("delete", cal_id, summary, d.event.title, list(d.message_ids), existing["id"], existing=existing))
+            elif existing:
+                builder.put(existing["id"], PlannedOperation("patch", cal_id, summary, d.event.title, list(d.message_ids), existing["id"], body, existing))
+            elif (instance_id := builder.series_instance(cal_id, summary, d.event)):
+                # Occurrences of a weekly series are overrides of its recurring event rather than new events
+                instance = cache.get(cal_id, instance_id) if cache.contains(cal_id, instance_id) else {}
+                builder.put(instance_id, PlannedOperation("patch", cal_id, summary, d.event.title, list(d.message_ids), instance_id, body, instance))
+            else:
+                builder.put(f"new:{d.key}", PlannedOperation("create", cal_id, summary, d.event.title, list(d.message_ids), None, {**body, "iCalUID": d.ical_uid}))
+
+    for msg_id, pe in updates:
+        logging.info(f"Handling event update: {pe.email_type}")
+        logging.info(f"Original event reference: {pe.original_event_ref}")
+        cal_ids = {s: cal_map[s] for s in all_summaries if s in cal_map}
+        # Only touch the calendars holding the original event; fan out to all of them if it can't be located
+        target_summaries = locate_event_calendars(pe, cal_ids, state, cache)
+        if target_summaries:
+            logging.info(f"Original event located in: {target_summaries}")
+        else:
+            logging.info("Original event not located locally, checking all calendars")
+            target_summaries = list(cal_ids)
+
+        base_body = build_event_body(pe, msg_id)
+        for summary in target_summaries:
+            cal_id = cal_ids[summary]
+            existing_event_id = find_existing_event(cache.calendar, cal_id, pe, state, cache)
+            if not existing_event_id:
+                logging.info(f"No existing event found to update in calendar: {summary}")
+                continue
+            existing = cache.get(cal_id, existing_event_id)
+            title = existing.get("summary", "Journal Club")
+            if pe.email_type == "cancellation":
+                builder.put(existing_event_id, PlannedOperation("delete", cal_id, summary, title, [msg_id], existing_event_id, existing=existing))
+                continue
+            body = dict(base_body)
+            # Preserve some original information if not provided in update
+            if not pe.title or pe.title == "Journal Club":
+                body["summary"] = title
+            if not pe.location:
+                body["location"] = existing.get("location", "")
+            builder.put(existing_event_id, PlannedOperation("patch", cal_id, summary, body["summary"], [msg_id], existing_event_id, body, existing))
+
+    return ReconciliationPlan(operations=builder.finalize(), message_ids=[m.message_id for m in messages])
+
+def format_plan(plan: ReconciliationPlan) -> str:
+    counts: Dict[str, int] = {}
+    lines = []
+    for op in plan.operations:
+        counts[op.kind] = counts.get(op.kind, 0) + 1
+        detail = ""
+        if op.kind == "patch":
+            detail = f" fields={sorted(k for k in op.body if k != 'extendedProperties')}"
+        elif op.series_slot:
+            detail = f" weekly series {op.series_slot}"
+        target = op.event_id or "(new)"
+        lines.append(f"{op.kind.upper():7} {op.calendar_summary} | {op.title[:60]} | event={target}{detail} | messages={','.join(op.message_ids)}")
+    summary = ", ".join(f"{n} {kind}" for kind, n in sorted(counts.items())) or "nothing to do"
+    return "\n".join([f"Plan for {len(plan.message_ids)} messages: {summary}"] + lines)
+
+def execute_plan(plan: ReconciliationPlan, calendar, state: StateStore, cache: EventWindowCache) -> Dict[str, MessageEventMap]:
+    """Execute every planned write in bulk batch requests and map results back to the messages"""
+    results = {m: MessageEventMap(message_id=m, category_to_event_ids={}) for m in plan.message_ids}
+    batch = CalendarBatch(calendar)
+
+    # Recurring events must exist, and cover their new occurrences, before those can be overridden
+    series_ops = [op for op in plan.operations if op.series_slot]
+    for op in series_ops:
+        def on_series_created(event: dict, op=op) -> None:
+            cache.upsert(op.cal_id, event)
+            state.save_series(op.series_slot, {"cal_id": op.cal_id, "event_id": op.event_id, "start": op.body["start"]["dateTime"]})
+            logging.info(f"Created weekly series {op.event_id} in {op.calendar_summary}")
+
+        def on_series_extended(event: dict, op=op) -> None:
+            cache.upsert(op.cal_id, event)
+            logging.info(f"Weekly series {op.event_id} in {op.calendar_summary} now runs {event.get('recurrence')}")
+
+        def on_series_error(error: Exception, op=op) -> None:
+            if op.kind == "create" and http_status(error) == 409:
+                # Created by an earlier run whose state was not saved; the ID is deterministic
+                patch = calendar.events().patch(calendarId=op.cal_id, eventId=op.event_id, body={"recurrence": op.body["recurrence"]})
+                on_series_created(execute(patch, "calendar"))
+                return
+            logging.error(f"Error applying {op.kind} of weekly series in {op.calendar_summary}: {error}")
+
+        if op.kind == "create":
+            batch.add(calendar.events().insert(calendarId=op.cal_id, body=op.body), on_series_created, on_series_error, label=f"create series {op.event_id}")
+        else:
+            batch.add(calendar.events().patch(calendarId=op.cal_id, eventId=op.event_id, body=op.body), on_series_extended, on_series_error, label=f"bound series {op.event_id}")
+    batch.execute()
+
+    for op in plan.operations:
+        if op.series_slot:
+            continue
+
+        def record(event: dict, op=op) -> None:
+            cache.upsert(op.cal_id, event)
+            for msg_id in op.message_ids:
+                state.save_event_ref(msg_id, op.cal_id, event["id"])
+                results[msg_id].category_to_event_ids[op.calendar_summary] = event["id"]
+
+        def on_deleted(_, op=op) -> None:
+            cache.remove(op.cal_id, op.event_id)
+            source = source_message_id(op.existing or {})
+            for msg_id in op.message_ids + ([source] if source else []):
+                state.remove_event_ref(msg_id, op.cal_id)
+                if msg_id in results:
+                    results[msg_id].category_to_event_ids[op.calendar_summary] = op.event_id  # Track the deleted event
+            logging.info(f"Deleted event {op.event_id} from {op.calendar_summary}")
+
+        def on_error(error: Exception, op=op) -> None:
+            if op.kind == "delete" and http_status(error) in (404, 410):
+                on_deleted(None)
+                return
+            logging.error(f"Error applying {op.kind} for '{op.title}' in {op.calendar_summary}: {error}")
+            for msg_id in op.message_ids:
+                results[msg_id].failed_categories.append(op.calendar_summary)
+
+        if op.kind == "noop":
+            logging.info(f"Event {op.event_id} unchanged, skipping write")
+            record(op.existing)
+        elif op.kind == "create":
+            batch.add(calendar.events().import_(calendarId=op.cal_id, body=op.body), record, on_error, label=f"create in {op.calendar_summary}")
+        elif op.kind == "patch":
+            batch.add(calendar.events().patch(calendarId=op.cal_id, eventId=op.event_id, body=op.body), record, on_error, label=f"patch {op.event_id}")
+        elif op.kind == "delete":
+            batch.add(calendar.events().delete(calendarId=op.cal_id, eventId=op.event_id), on_deleted, on_error, label=f"delete {op.event_id}")
+
+    batch.execute()
+    return results
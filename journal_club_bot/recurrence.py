@@ -0,0 +1,106 @@
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo
+from .event_index import parse_event_start
+from .models import ParsedEvent
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+# Skipped weeks (holidays, no speaker) don't break a series, longer gaps do
+MAX_GAP_WEEKS = 3
+
+def _local(start: datetime, tz: str) -> datetime:
+    if start.tzinfo is None:
+        return start.replace(tzinfo=ZoneInfo(tz))
+    return start.astimezone(ZoneInfo(tz))
+
+def _normalize_location(location: Optional[str]) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", (location or "").lower()))
+
+def slot_key(cal_id: str, start: datetime, location: Optional[str], tz: str) -> str:
+    """Weekly slot of an occurrence: calendar, weekday, local start time and room"""
+    local = _local(start, tz)
+    return f"{cal_id}|{WEEKDAYS[local.weekday()]}|{local:%H:%M}|{_normalize_location(location)}"
+
+def event_slot_key(cal_id: str, pe: ParsedEvent, tz: str) -> str:
+    return slot_key(cal_id, pe.start, pe.location, tz)
+
+def is_weekly(starts: Iterable[datetime], min_occurrences: int) -> bool:
+    """Whether the most recent min_occurrences dates are a whole number of weeks apart, without long gaps"""
+    days = sorted({s.date() for s in starts})
+    if min_occurrences < 2 or len(days) < min_occurrences:
+        return False
+    recent = days[-min_occurrences:]
+    for a, b in zip(recent, recent[1:]):
+        gap = (b - a).days
+        if gap % 7 or gap > 7 * MAX_GAP_WEEKS:
+            return False
+    return True
+
+def series_event_id(slot: str) -> str:
+    """Deterministic event ID for a slot's recurring event (Calendar IDs allow base32hex characters)"""
+    return "jcs" + hashlib.sha1(slot.encode("utf-8")).hexdigest()[:26]
+
+def instance_event_id(series_id: str, start: datetime, tz: str) -> str:
+    """ID of one occurrence of a recurring event, addressable before it has ever been modified"""
+    return f"{series_id}_{_local(start, tz).astimezone(timezone.utc):%Y%m%dT%H%M%SZ}"
+
+def series_recurrence(first: datetime, announced: Iterable[datetime], tz: str) -> List[str]:
+    """
+    Recurrence lines for a series starting at first: weekly on its weekday UNTIL the last
+    announced occurrence, with every unannounced week in between excluded, so the calendar
+    shows no placeholder for breaks, weeks without a talk or after the club stops.
+    """
+    local_first = _local(first, tz).replace(tzinfo=None)
+    days = {_local(start, tz).date() for start in announced} | {local_first.date()}
+    last = max(days)
+    until = datetime.combine(last, local_first.time()).replace(tzinfo=ZoneInfo(tz)).astimezone(timezone.utc)
+    lines = [f"RRULE:FREQ=WEEKLY;BYDAY={WEEKDAYS[local_first.weekday()]};UNTIL={until:%Y%m%dT%H%M%SZ}"]
+    skipped = []
+    week = local_first
+    while week.date() <= last:
+        if week.date() not in days:
+            skipped.append(f"{week:%Y%m%dT%H%M%S}")
+        week += timedelta(weeks=1)
+    if skipped:
+        lines.append(f"EXDATE;TZID={tz}:{','.join(skipped)}")
+    return lines
+
+def series_body(pe: ParsedEvent, calendar_summary: str, recurrence: List[str]) -> dict:
+    """Recurring event starting at pe; occurrences get their titles and speakers as overrides"""
+    body = {
+        "summary": calendar_summary,
+        "description": "Weekly journal club. Talks are filled in per occurrence as they are announced.",
+        "start": {"dateTime": pe.start.isoformat(), "timeZone": pe.timezone},
+        "end": {"dateTime": pe.end.isoformat(), "timeZone": pe.timezone},
+        "recurrence": recurrence,
+    }
+    if pe.location:
+        body["location"] = pe.location
+    return body
+
+def series_overrides(events: Dict[str, dict], series_id: str) -> List[datetime]:
+    """Original start times of the occurrences of a recurring event the bot has filled in"""
+    starts = []
+    for event in events.values():
+        if event.get("recurringEventId") != series_id:
+            continue
+        original = event.get("originalStartTime", {}).get("dateTime")
+        if original:
+            starts.append(datetime.fromisoformat(original.replace("Z", "+00:00")))
+    return starts
+
+def bot_occurrences(events: Dict[str, dict], cal_id: str, tz: str) -> Dict[str, List[datetime]]:
+    """Slot -> start times of the single events the bot has created in a calendar"""
+    slots: Dict[str, List[datetime]] = {}
+    for event in events.values():
+        if event.get("recurrence") or event.get("recurringEventId"):
+            continue
+        if not event.get("extendedProperties", {}).get("private", {}).get("source_msg_id"):
+            continue
+        start = parse_event_start(event)
+        if start is None:
+            continue
+        slots.setdefault(slot_key(cal_id, start, event.get("location"), tz), []).append(start)
+    return slots
@@ -0,0 +1,65 @@
+import base64
+import hashlib
+import math
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Optional
+
+DAY_SECONDS = 86400
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over message IDs. A miss means the ID was never added;
+    a hit may be a false positive (about error_rate at capacity) and must be confirmed.
+    """
+
+    def __init__(self, capacity: int = 10_000, error_rate: float = 0.001, bits: Optional[bytearray] = None, hashes: Optional[int] = None) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.size = size if bits is None else len(bits) * 8
+        self.hashes = hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "hashes": self.hashes,
+            "count": self.count,
+            "bits": base64.b64encode(bytes(self.bits)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BloomFilter":
+        bloom = cls(data["capacity"], data["error_rate"], bytearray(base64.b64decode(data["bits"])), data["hashes"])
+        bloom.count = data.get("count", 0)
+        return bloom
+
+def expires_at(seen: float, event_end: Optional[datetime], lookback_days: int, grace_days: int) -> float:
+    """
+    A message can be forgotten once Gmail no longer returns it (lookback window) and, for events,
+    once the event is over so no update or cancellation can refer to it; both plus a grace period.
+    """
+    until = seen + (lookback_days + grace_days) * DAY_SECONDS
+    if event_end is not None:
+        until = max(until, event_end.timestamp() + grace_days * DAY_SECONDS)
+    return until
+
+def files_size(paths: Iterable[Path]) -> int:
+    return sum(p.stat().st_size for p in paths if p.exists())
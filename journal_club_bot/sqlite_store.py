@@ -0,0 +1,354 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from .models import MessageEventMap, MessageFingerprint
+from .retention import DAY_SECONDS, files_size
+from .storage import StateStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS processed (
+    message_id TEXT PRIMARY KEY,
+    processed_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS event_mappings (
+    message_id TEXT NOT NULL,
+    calendar_summary TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    PRIMARY KEY (message_id, calendar_summary)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS event_refs (
+    message_id TEXT NOT NULL,
+    cal_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    PRIMARY KEY (message_id, cal_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS event_refs_by_event ON event_refs (cal_id, event_id);
+CREATE TABLE IF NOT EXISTS calendars (summary TEXT PRIMARY KEY, cal_id TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fingerprints (message_id TEXT PRIMARY KEY, simhash TEXT NOT NULL, numbers TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_tokens (cal_id TEXT PRIMARY KEY, token TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series (slot TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mirror_events (
+    cal_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (cal_id, event_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mirrors (cal_id TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS retention (message_id TEXT PRIMARY KEY, event_end REAL) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS archived (message_id TEXT PRIMARY KEY) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS claims (message_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL) WITHOUT ROWID;
+"""
+
+class SQLiteStateStore(StateStore):
+    """
+    StateStore kept in state/state.db (SQLite, WAL mode) with indexed tables, so membership checks and
+    single-message updates cost one indexed lookup or row write regardless of history size.
+    The JSON files of an existing state directory are imported once on first open.
+    """
+
+    def _initialize(self) -> None:
+        self.db_path = self.base / "state.db"
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        if self._meta("migrated_from_json") is None:
+            self._migrate_from_json()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def _migrate_from_json(self) -> None:
+        """
+        One-time import of processed.json, event_refs.json and the other JSON state files. Archive
+        segments become archived IDs, so messages the JSON store pruned stay deduplicated, and
+        retention.json keeps each message's retention clock and event end.
+        """
+        def read(path, default):
+            return json.loads(path.read_text(encoding="utf-8")) if path.exists() else default
+
+        processed = read(self.processed_path, {})
+        cal_map = read(self.calendars_path, {})
+        refs = read(self.event_refs_path, None)
+        if refs is None:
+            refs = {}
+            for message_id, summary_to_event in processed.items():
+                by_calendar = {cal_map[s]: ev_id for s, ev_id in summary_to_event.items() if s in cal_map}
+                if by_calendar:
+                    refs[message_id] = by_calendar
+        sync_tokens = read(self.sync_tokens_path, {})
+        retention = read(self.retention_path, {})
+        seen = retention.get("messages", {})
+        archived = set()
+        for segment in self._archive_segments():
+            archived.update(read(segment, {}))
+        now = time.time()
+
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO processed VALUES (?, ?)",
+                ((m, seen.get(m, {}).get("seen") or now) for m in processed),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO retention VALUES (?, ?)",
+                (
+                    (m, datetime.fromisoformat(entry["event_end"]).timestamp() if entry.get("event_end") else None)
+                    for m, entry in seen.items() if m in processed
+                ),
+            )
+            conn.executemany("INSERT OR IGNORE INTO archived VALUES (?)", ((m,) for m in archived if m not in processed))
+            conn.executemany(
+                "INSERT OR REPLACE INTO event_mappings VALUES (?, ?, ?)",
+                ((m, s, e) for m, mapping in processed.items() for s, e in mapping.items()),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO event_refs VALUES (?, ?, ?)",
+                ((m, c, e) for m, by_cal in refs.items() for c, e in by_cal.items()),
+            )
+            conn.executemany("INSERT OR REPLACE INTO calendars VALUES (?, ?)", cal_map.items())
+            conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)",
+                ((m, fp["simhash"], fp["numbers"]) for m, fp in read(self.fingerprints_path, {}).items()),
+            )
+            conn.executemany("INSERT OR REPLACE INTO sync_tokens VALUES (?, ?)", sync_tokens.items())
+            conn.executemany(
+                "INSERT OR REPLACE INTO series VALUES (?, ?)",
+                ((slot, json.dumps(data)) for slot, data in read(self.series_path, {}).items()),
+            )
+            # Mirror files are named after a sanitized calendar ID; the sync token keys give the real ones
+            for token_key in sync_tokens:
+                cal_id = token_key.rpartition("#")[0] or token_key
+                mirror = read(self._mirror_path(cal_id), None)
+                if mirror is not None:
+                    self._write_mirror(conn, cal_id, mirror)
+            directory = read(self.calendar_directory_path, None)
+            if directory is not None:
+                self._set_meta("calendar_directory", directory)
+            if "last_pruned" in retention:
+                self._set_meta("last_pruned", retention["last_pruned"])
+            self._set_meta("migrated_from_json", now)
+        if processed or archived:
+            logging.info(f"Migrated JSON state into {self.db_path}: {len(processed)} processed and {len(archived)} archived messages")
+
+    def is_processed(self, message_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM processed WHERE message_id = ? UNION ALL SELECT 1 FROM archived WHERE message_id = ? LIMIT 1",
+                (message_id, message_id),
+            ).fetchone()
+        return row is not None
+
+    def mark_processed(self, message_id: str, mapping: MessageEventMap) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO processed VALUES (?, ?)", (message_id, time.time()))
+            conn.execute(
+                "INSERT OR REPLACE INTO retention VALUES (?, ?)",
+                (message_id, mapping.event_end.timestamp() if mapping.event_end else None),
+            )
+            conn.execute("DELETE FROM event_mappings WHERE message_id = ?", (message_id,))
+            conn.executemany(
+                "INSERT INTO event_mappings VALUES (?, ?, ?)",
+                ((message_id, s, e) for s, e in mapping.category_to_event_ids.items()),
+            )
+
+    def claim(self, message_ids: Iterable[str], owner: str, lease_seconds: float, limit: Optional[int] = None) -> List[str]:
+        """Lease messages in one write transaction; an existing lease is taken over only once expired"""
+        now = time.time()
+        claimed = []
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM claims WHERE expires_at <= ?", (now,))
+            for message_id in message_ids:
+                if limit is not None and len(claimed) >= limit:
+                    break
+                if conn.execute(
+                    "SELECT 1 FROM processed WHERE message_id = ? UNION ALL SELECT 1 FROM archived WHERE message_id = ? LIMIT 1",
+                    (message_id, message_id),
+                ).fetchone():
+                    continue
+                cursor = conn.execute(
+                    """INSERT INTO claims VALUES (?, ?, ?)
+                       ON CONFLICT (message_id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                       WHERE claims.owner = excluded.owner""",
+                    (message_id, owner, now + lease_seconds),
+                )
+                if cursor.rowcount:
+                    claimed.append(message_id)
+        return claimed
+
+    def release(self, message_ids: Iterable[str], owner: str) -> None:
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM claims WHERE message_id = ? AND owner = ?", ((m, owner) for m in message_ids))
+
+    def prune(self, force: bool = False) -> Optional[dict]:
+        """
+        Move processed messages past retention into the archived ID table (no mappings, refs or
+        fingerprints kept) and VACUUM. Archived IDs still count as processed.
+        """
+        cfg = self.load_settings()
+        now = time.time()
+        with self._lock:
+            last_pruned = json.loads(self._meta("last_pruned") or "0")
+        if not force and now - last_pruned < float(cfg.get("retention_prune_interval_hours", 24)) * 3600:
+            return None
+        lookback = (int(cfg.get("lookback_days", 14)) + int(cfg.get("retention_grace_days", 7))) * DAY_SECONDS
+        grace = int(cfg.get("retention_grace_days", 7)) * DAY_SECONDS
+
+        db_files = [self.db_path, self.db_path.with_name("state.db-wal")]
+        bytes_before = files_size(db_files)
+        with self._transaction() as conn:
+            messages_before = conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+            conn.execute("DROP TABLE IF EXISTS temp.expired")
+            conn.execute(
+                """CREATE TEMP TABLE expired AS
+                   SELECT p.message_id FROM processed p LEFT JOIN retention r USING (message_id)
+                   WHERE p.processed_at + ? < ? AND COALESCE(r.event_end + ?, 0) < ?""",
+                (lookback, now, grace, now),
+            )
+            archived = conn.execute("SELECT COUNT(*) FROM temp.expired").fetchone()[0]
+            conn.execute("INSERT OR IGNORE INTO archived SELECT message_id FROM temp.expired")
+            for table in ("processed", "event_mappings", "event_refs", "fingerprints", "retention"):
+                conn.execute(f"DELETE FROM {table} WHERE message_id IN (SELECT message_id FROM temp.expired)")
+            conn.execute("DROP TABLE temp.expired")
+            self._set_meta("last_pruned", now)
+        if archived:
+            with self._lock:
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self._conn.execute("VACUUM")
+
+        report = {
+            "messages_before": messages_before,
+            "messages_after": messages_before - archived,
+            "archived": archived,
+            "bytes_before": bytes_before,
+            "bytes_after": files_size(db_files),
+        }
+        logging.info(f"State pruned: {report['messages_before']} -> {report['messages_after']} messages, "
+                     f"{report['bytes_before'] / 1024:.1f} KB -> {report['bytes_after'] / 1024:.1f} KB")
+        return report
+
+    def load_mapping(self, message_id: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM processed WHERE message_id = ?", (message_id,)).fetchone() is None:
+                return None
+            rows = self._conn.execute(
+                "SELECT calendar_summary, event_id FROM event_mappings WHERE message_id = ?", (message_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def load_event_refs(self, message_id: str) -> Dict[str, str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT cal_id, event_id FROM event_refs WHERE message_id = ?", (message_id,)).fetchall()
+        return dict(rows)
+
+    def save_event_ref(self, message_id: str, cal_id: str, event_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO event_refs VALUES (?, ?, ?)", (message_id, cal_id, event_id))
+
+    def remove_event_ref(self, message_id: str, cal_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM event_refs WHERE message_id = ? AND cal_id = ?", (message_id, cal_id))
+
+    def load_fingerprints(self) -> Dict[str, MessageFingerprint]:
+        with self._lock:
+            rows = self._conn.execute("SELECT message_id, simhash, numbers FROM fingerprints").fetchall()
+        return {m: MessageFingerprint(simhash=int(h, 16), numbers=n) for m, h, n in rows}
+
+    def save_fingerprint(self, message_id: str, fp: MessageFingerprint) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)", (message_id, f"{fp.simhash:016x}", fp.numbers))
+
+    def load_calendar_map(self) -> Optional[Dict[str, str]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT summary, cal_id FROM calendars").fetchall()
+        return dict(rows) if rows else None
+
+    def save_calendar_map(self, mapping: Dict[str, str]) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM calendars")
+            conn.executemany("INSERT INTO calendars VALUES (?, ?)", mapping.items())
+
+    def load_calendar_directory(self) -> Optional[dict]:
+        with self._lock:
+            value = self._meta("calendar_directory")
+        return json.loads(value) if value is not None else None
+
+    def save_calendar_directory(self, meta: dict) -> None:
+        with self._transaction():
+            self._set_meta("calendar_directory", meta)
+
+    def load_sync_token(self, cal_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT token FROM sync_tokens WHERE cal_id = ?", (cal_id,)).fetchone()
+        return row[0] if row else None
+
+    def save_sync_token(self, cal_id: str, token: Optional[str]) -> None:
+        with self._transaction() as conn:
+            if token:
+                conn.execute("INSERT OR REPLACE INTO sync_tokens VALUES (?, ?)", (cal_id, token))
+            else:
+                conn.execute("DELETE FROM sync_tokens WHERE cal_id = ?", (cal_id,))
+
+    def load_series(self) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT slot, data FROM series").fetchall()
+        return {slot: json.loads(data) for slot, data in rows}
+
+    def save_series(self, slot: str, series: dict) -> None:
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO series VALUES (?, ?)", (slot, json.dumps(series)))
+
+    def load_calendar_mirror(self, cal_id: str) -> Optional[Dict[str, dict]]:
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM mirrors WHERE cal_id = ?", (cal_id,)).fetchone() is None:
+                return None
+            rows = self._conn.execute("SELECT event_id, data FROM mirror_events WHERE cal_id = ?", (cal_id,)).fetchall()
+        return {event_id: json.loads(data) for event_id, data in rows}
+
+    def save_calendar_mirror(self, cal_id: str, events: Dict[str, dict]) -> None:
+        with self._transaction() as conn:
+            self._write_mirror(conn, cal_id, events)
+
+    @staticmethod
+    def _write_mirror(conn: sqlite3.Connection, cal_id: str, events: Dict[str, dict]) -> None:
+        conn.execute("INSERT OR IGNORE INTO mirrors VALUES (?)", (cal_id,))
+        conn.execute("DELETE FROM mirror_events WHERE cal_id = ?", (cal_id,))
+        conn.executemany(
+            "INSERT INTO mirror_events VALUES (?, ?, ?)",
+            ((cal_id, event_id, json.dumps(event)) for event_id, event in events.items()),
+        )
+
+class _Transaction:
+    """Serializes writers within the process and wraps them in BEGIN IMMEDIATE ... COMMIT"""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock) -> None:
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
@@ -1,8 +1,67 @@
 import json
+import logging
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional
-import yaml
-from .models import MessageEventMap
+from typing import Dict, Iterable, List, Optional, Set
+from .models import MessageEventMap, MessageFingerprint
+from .retention import BloomFilter, expires_at, files_size
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single local process, no cross-process lock needed
+    fcntl = None
+
+SETTINGS_PATH = Path("config/settings.yml")
+# Older archive segments are merged into one once there are more than this
+MAX_ARCHIVE_SEGMENTS = 8
+
+def _write_json_atomic(path: Path, data, indent: Optional[int] = 2) -> str:
+    """Write JSON to a temp file in the same directory and rename it over the target; returns the text"""
+    text = json.dumps(data, indent=indent)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return text
+
+# Top-level keys holding a map of records (retention.json's "messages"), merged per record
+_NESTED_KEYS = ("messages",)
+
+def merge_changes(base, local, remote, nested=_NESTED_KEYS):
+    """
+    Three-way merge of one state file: local changes since base, applied on top of remote.
+    Keys are merged at the top level, and one level deeper under the nested keys.
+    """
+    if not isinstance(local, dict) or not isinstance(remote, dict):
+        return local
+    base = base if isinstance(base, dict) else {}
+    merged = dict(remote)
+    for key, value in local.items():
+        if base.get(key) == value:
+            continue
+        if key in nested:
+            merged[key] = merge_changes(base.get(key), value, remote.get(key), nested=())
+        else:
+            merged[key] = value
+    for key in base:
+        if key not in local:
+            merged.pop(key, None)
+    return merged
+
+def _read_settings(path: Path) -> dict:
+    import yaml
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
 
 class StateStore:
     def __init__(self, base_dir: str) -> None:
@@ -10,27 +69,365 @@ class StateStore:
         self.base.mkdir(parents=True, exist_ok=True)
         self.processed_path = self.base / "processed.json"
         self.calendars_path = self.base / "calendars.json"
-        self.settings_path = Path("config/settings.yml")
+        self.calendar_directory_path = self.base / "calendar_directory.json"
+        self.fingerprints_path = self.base / "fingerprints.json"
+        self.event_refs_path = self.base / "event_refs.json"
+        self.sync_tokens_path = self.base / "sync_tokens.json"
+        self.series_path = self.base / "series.json"
+        self.mirrors_dir = self.base / "mirrors"
+        self.retention_path = self.base / "retention.json"
+        self.archive_dir = self.base / "archive"
+        self.bloom_path = self.base / "pruned.bloom.json"
+        self.claims_path = self.base / "claims.json"
+        self.settings_path = SETTINGS_PATH
+        self._session: Optional[Dict[Path, object]] = None
+        self._dirty: Dict[Path, Optional[int]] = {}
+        self._base_text: Dict[Path, str] = {}
+        self._bloom: Optional[BloomFilter] = None
+        self._archived: Optional[Set[str]] = None
+        self._initialize()
+
+    def _initialize(self) -> None:
         if not self.processed_path.exists():
             self.processed_path.write_text("{}", encoding="utf-8")
+        if not self.event_refs_path.exists():
+            self._migrate_event_refs()
+
+    @contextmanager
+    def session(self):
+        """
+        Serve reads from memory and buffer writes until flush() or the end of the block,
+        so a run does no per-message file I/O. Each file is still replaced atomically.
+        """
+        self._session, self._dirty, self._base_text = {}, {}, {}
+        try:
+            yield self
+        finally:
+            self.flush()
+            self._session = None
+
+    def flush(self) -> None:
+        """Write the files changed in this session (a checkpoint); no-op outside a session"""
+        if self._session is None or not self._dirty:
+            return
+        # Another process may have written since the session read a file: merge its changes in
+        with self._state_lock():
+            for path, indent in self._dirty.items():
+                data = self._session[path]
+                base_text = self._base_text.get(path)
+                if base_text is not None and path.exists():
+                    disk_text = path.read_text(encoding="utf-8")
+                    if disk_text != base_text:
+                        data = merge_changes(json.loads(base_text), data, json.loads(disk_text))
+                        self._session[path] = data
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._base_text[path] = _write_json_atomic(path, data, indent=indent)
+        if self._dirty:
+            logging.info(f"State checkpoint: wrote {len(self._dirty)} files")
+        self._dirty = {}
+
+    def _read(self, path: Path):
+        session = self._session
+        if session is not None and path in session:
+            return session[path]
+        text = path.read_text(encoding="utf-8") if path.exists() else None
+        data = json.loads(text) if text is not None else None
+        if session is not None:
+            session[path] = data
+            if text is not None:
+                self._base_text[path] = text
+        return data
+
+    def _write(self, path: Path, data, indent: Optional[int] = 2) -> None:
+        session = self._session
+        if session is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            _write_json_atomic(path, data, indent=indent)
+            return
+        session[path] = data
+        self._dirty[path] = indent
 
     def is_processed(self, message_id: str) -> bool:
-        data = json.loads(self.processed_path.read_text(encoding="utf-8"))
-        return message_id in data
+        return message_id in self._read(self.processed_path) or self._was_pruned(message_id)
 
     def mark_processed(self, message_id: str, mapping: MessageEventMap) -> None:
-        data = json.loads(self.processed_path.read_text(encoding="utf-8"))
+        data = self._read(self.processed_path)
         data[message_id] = mapping.category_to_event_ids
-        self.processed_path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        self._write(self.processed_path, data)
+        retention = self._read(self.retention_path) or {}
+        retention.setdefault("messages", {})[message_id] = {
+            "seen": time.time(),
+            "event_end": mapping.event_end.isoformat() if mapping.event_end else None,
+        }
+        self._write(self.retention_path, retention)
 
-    def load_calendar_map(self) -> Optional[Dict[str, str]]:
-        if not self.calendars_path.exists():
+    @contextmanager
+    def _state_lock(self):
+        """Exclusive lock shared by all processes using this state directory"""
+        with open(self.base / ".state.lock", "a+") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def claim(self, message_ids: Iterable[str], owner: str, lease_seconds: float, limit: Optional[int] = None) -> List[str]:
+        """
+        Lease up to limit of the messages to owner, skipping processed ones and ones leased to
+        another owner whose lease has not expired. Claims bypass the session: they are shared
+        with other processes through claims.json under an exclusive file lock.
+        """
+        with self._state_lock():
+            claims = json.loads(self.claims_path.read_text(encoding="utf-8")) if self.claims_path.exists() else {}
+            processed = json.loads(self.processed_path.read_text(encoding="utf-8"))
+            now = time.time()
+            claims = {m: c for m, c in claims.items() if c["expires"] > now}
+            claimed = []
+            for message_id in message_ids:
+                if limit is not None and len(claimed) >= limit:
+                    break
+                lease = claims.get(message_id)
+                if lease is not None and lease["owner"] != owner:
+                    continue
+                if message_id in processed or self.is_processed(message_id):
+                    continue
+                claims[message_id] = {"owner": owner, "expires": now + lease_seconds}
+                claimed.append(message_id)
+            _write_json_atomic(self.claims_path, claims)
+        return claimed
+
+    def release(self, message_ids: Iterable[str], owner: str) -> None:
+        """Give up owner's leases so other workers can claim the messages right away"""
+        message_ids = set(message_ids)
+        if not message_ids:
+            return
+        with self._state_lock():
+            if not self.claims_path.exists():
+                return
+            claims = json.loads(self.claims_path.read_text(encoding="utf-8"))
+            for message_id in message_ids:
+                if claims.get(message_id, {}).get("owner") == owner:
+                    del claims[message_id]
+            _write_json_atomic(self.claims_path, claims)
+
+    def _archive_segments(self):
+        return sorted(self.archive_dir.glob("processed-*.json"))
+
+    def _was_pruned(self, message_id: str) -> bool:
+        """Bloom filter first (no false negatives); hits are confirmed against the archive"""
+        if self._bloom is None:
+            if not self.bloom_path.exists():
+                return False
+            self._bloom = BloomFilter.from_dict(json.loads(self.bloom_path.read_text(encoding="utf-8")))
+        if message_id not in self._bloom:
+            return False
+        if self._archived is None:
+            self._archived = set()
+            for segment in self._archive_segments():
+                self._archived.update(json.loads(segment.read_text(encoding="utf-8")))
+        return message_id in self._archived
+
+    def _state_files(self):
+        return [p for p in self.base.rglob("*.json") if p.parent != self.mirrors_dir]
+
+    def prune(self, force: bool = False) -> Optional[dict]:
+        """
+        Move processed entries past retention into a compact archive segment, add their IDs to the
+        pruned-ID Bloom filter and drop their refs and fingerprints. Runs at most once per
+        retention_prune_interval_hours unless forced. Returns a size report, or None if not due.
+        """
+        cfg = self.load_settings()
+        now = time.time()
+        retention = self._read(self.retention_path) or {}
+        if not force and now - retention.get("last_pruned", 0) < float(cfg.get("retention_prune_interval_hours", 24)) * 3600:
             return None
-        return json.loads(self.calendars_path.read_text(encoding="utf-8"))
+        lookback_days = int(cfg.get("lookback_days", 14))
+        grace_days = int(cfg.get("retention_grace_days", 7))
+
+        self.flush()
+        bytes_before = files_size(self._state_files())
+        processed = self._read(self.processed_path)
+        messages_before = len(processed)
+        meta = retention.setdefault("messages", {})
+
+        expired = []
+        for message_id in processed:
+            entry = meta.get(message_id)
+            if entry is None:
+                # Entries from before retention tracking start their clock now
+                meta[message_id] = entry = {"seen": now, "event_end": None}
+            event_end = datetime.fromisoformat(entry["event_end"]) if entry.get("event_end") else None
+            if expires_at(entry["seen"], event_end, lookback_days, grace_days) < now:
+                expired.append(message_id)
+
+        if expired:
+            segment = {message_id: processed.pop(message_id) for message_id in expired}
+            refs = self._read(self.event_refs_path)
+            fingerprints = self._read(self.fingerprints_path) or {}
+            for message_id in expired:
+                refs.pop(message_id, None)
+                fingerprints.pop(message_id, None)
+                meta.pop(message_id, None)
+            self._write(self.archive_dir / f"processed-{int(now * 1000)}.json", segment, indent=None)
+            self._write(self.processed_path, processed)
+            self._write(self.event_refs_path, refs)
+            self._write(self.fingerprints_path, fingerprints)
+
+            bloom = self._load_bloom(len(segment))
+            for message_id in expired:
+                bloom.add(message_id)
+            self._write(self.bloom_path, bloom.to_dict(), indent=None)
+            self._bloom = bloom
+            if self._archived is not None:
+                self._archived.update(expired)
+
+        retention["last_pruned"] = now
+        self._write(self.retention_path, retention)
+        self.flush()
+        if len(self._archive_segments()) > MAX_ARCHIVE_SEGMENTS:
+            self._compact_archive()
+
+        report = {
+            "messages_before": messages_before,
+            "messages_after": len(processed),
+            "archived": len(expired),
+            "bytes_before": bytes_before,
+            "bytes_after": files_size(self._state_files()),
+        }
+        logging.info(f"State pruned: {report['messages_before']} -> {report['messages_after']} messages, "
+                     f"{report['bytes_before'] / 1024:.1f} KB -> {report['bytes_after'] / 1024:.1f} KB")
+        return report
+
+    def _load_bloom(self, adding: int) -> BloomFilter:
+        bloom = BloomFilter.from_dict(json.loads(self.bloom_path.read_text(encoding="utf-8"))) if self.bloom_path.exists() else None
+        if bloom is not None and bloom.count + adding <= bloom.capacity:
+            return bloom
+        # Grow by rebuilding from the archive so the false-positive rate stays bounded
+        archived = set()
+        for segment in self._archive_segments():
+            archived.update(json.loads(segment.read_text(encoding="utf-8")))
+        bloom = BloomFilter(capacity=max(10_000, 2 * (len(archived) + adding)))
+        for message_id in archived:
+            bloom.add(message_id)
+        return bloom
+
+    def _compact_archive(self) -> None:
+        """Merge archive segments into one, ID -> mapping, without whitespace"""
+        segments = self._archive_segments()
+        merged = {}
+        for segment in segments:
+            merged.update(json.loads(segment.read_text(encoding="utf-8")))
+        target = segments[-1]
+        _write_json_atomic(target, merged, indent=None)
+        for segment in segments[:-1]:
+            segment.unlink()
+        logging.info(f"Compacted {len(segments)} archive segments ({len(merged)} messages) into {target.name}")
+
+    def load_mapping(self, message_id: str) -> Optional[Dict[str, str]]:
+        return self._read(self.processed_path).get(message_id)
+
+    def _migrate_event_refs(self) -> None:
+        """Build message -> {calendar_id: event_id} refs from processed.json and the calendar map"""
+        processed = self._read(self.processed_path)
+        cal_map = self.load_calendar_map() or {}
+        refs = {}
+        for message_id, summary_to_event in processed.items():
+            by_calendar = {cal_map[summary]: ev_id for summary, ev_id in summary_to_event.items() if summary in cal_map}
+            if by_calendar:
+                refs[message_id] = by_calendar
+        self._write(self.event_refs_path, refs)
+
+    def load_event_refs(self, message_id: str) -> Dict[str, str]:
+        """Calendar ID -> event ID for every event created from the message"""
+        return dict(self._read(self.event_refs_path).get(message_id, {}))
+
+    def save_event_ref(self, message_id: str, cal_id: str, event_id: str) -> None:
+        data = self._read(self.event_refs_path)
+        data.setdefault(message_id, {})[cal_id] = event_id
+        self._write(self.event_refs_path, data)
+
+    def remove_event_ref(self, message_id: str, cal_id: str) -> None:
+        data = self._read(self.event_refs_path)
+        refs = data.get(message_id)
+        if refs is None or cal_id not in refs:
+            return
+        del refs[cal_id]
+        if not refs:
+            del data[message_id]
+        self._write(self.event_refs_path, data)
+
+    def load_fingerprints(self) -> Dict[str, MessageFingerprint]:
+        data = self._read(self.fingerprints_path) or {}
+        return {
+            msg_id: MessageFingerprint(simhash=int(fp["simhash"], 16), numbers=fp["numbers"])
+            for msg_id, fp in data.items()
+        }
+
+    def save_fingerprint(self, message_id: str, fp: MessageFingerprint) -> None:
+        data = self._read(self.fingerprints_path) or {}
+        data[message_id] = {"simhash": f"{fp.simhash:016x}", "numbers": fp.numbers}
+        self._write(self.fingerprints_path, data)
+
+    def load_calendar_map(self) -> Optional[Dict[str, str]]:
+        return self._read(self.calendars_path)
 
     def save_calendar_map(self, mapping: Dict[str, str]) -> None:
-        self.calendars_path.write_text(json.dumps(mapping, indent=2), encoding="utf-8")
+        self._write(self.calendars_path, mapping)
+
+    def load_calendar_directory(self) -> Optional[dict]:
+        """Freshness metadata (fetched_at, etag) for the cached calendar map"""
+        return self._read(self.calendar_directory_path)
+
+    def save_calendar_directory(self, meta: dict) -> None:
+        self._write(self.calendar_directory_path, meta)
+
+    def load_sync_token(self, cal_id: str) -> Optional[str]:
+        return (self._read(self.sync_tokens_path) or {}).get(cal_id)
+
+    def save_sync_token(self, cal_id: str, token: Optional[str]) -> None:
+        data = self._read(self.sync_tokens_path) or {}
+        if token:
+            data[cal_id] = token
+        else:
+            data.pop(cal_id, None)
+        self._write(self.sync_tokens_path, data)
+
+    def load_series(self) -> Dict[str, dict]:
+        """Weekly slot -> recurring event that holds its occurrences (cal_id, event_id, start)"""
+        return self._read(self.series_path) or {}
+
+    def save_series(self, slot: str, series: dict) -> None:
+        data = self.load_series()
+        data[slot] = series
+        self._write(self.series_path, data)
+
+    def _mirror_path(self, cal_id: str) -> Path:
+        return self.mirrors_dir / (re.sub(r"[^A-Za-z0-9._@-]", "_", cal_id) + ".json")
+
+    def load_calendar_mirror(self, cal_id: str) -> Optional[Dict[str, dict]]:
+        return self._read(self._mirror_path(cal_id))
+
+    def save_calendar_mirror(self, cal_id: str, events: Dict[str, dict]) -> None:
+        self._write(self._mirror_path(cal_id), events, indent=None)
 
     def load_settings(self) -> dict:
-        with open(self.settings_path, "r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or {}
\ No newline at end of file
+        return _read_settings(self.settings_path)
+
+def open_state_store(base_dir: str, backend: Optional[str] = None) -> StateStore:
+    """Open the configured state backend: "json" (files, default), "sqlite" (state.db) or "gcs" (one GCS object)"""
+    cfg = _read_settings(SETTINGS_PATH)
+    backend = backend or os.environ.get("JC_STATE_BACKEND") or cfg.get("state_backend", "json")
+    if backend == "gcs":
+        from .gcs_store import GCSStateStore
+        bucket = os.environ.get("JC_STATE_BUCKET") or cfg.get("state_bucket")
+        if not bucket:
+            raise ValueError("state_backend gcs needs state_bucket (or JC_STATE_BUCKET)")
+        return GCSStateStore(base_dir, bucket, cfg.get("state_object", "journal-club-bot/state.json"))
+    if backend == "sqlite":
+        from .sqlite_store import SQLiteStateStore
+        return SQLiteStateStore(base_dir)
+    if backend != "json":
+        raise ValueError(f"Unknown state backend: {backend}")
+    return StateStore(base_dir)
@@ -1,82 +1,416 @@
 import argparse
+import importlib
+import json
 import logging
 import os
+import random
+import signal
+import socket
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 from journal_club_bot.auth import get_authorized_services
-from journal_club_bot.gmail_client import fetch_labeled_messages, extract_message_payload
-from journal_club_bot.parser import parse_event_from_text
-from journal_club_bot.categorizer import load_categories, categorize_text
-from journal_club_bot.calendar_client import (
-    ensure_category_calendars,
-    upsert_event_to_calendars,
-    delete_event_from_calendars,
-    handle_event_update,
+from journal_club_bot.gmail_client import fetch_labeled_messages, iter_message_payloads
+from journal_club_bot.parser import detect_email_type, parse_event_from_text, warm_up as warm_up_parser
+from journal_club_bot.categorizer import build_category_index, load_categories
+from journal_club_bot.calendar_client import ensure_category_calendars
+from journal_club_bot.event_cache import EventWindowCache
+from journal_club_bot.executor import EXECUTOR, timed
+from journal_club_bot.fingerprint import fingerprint_message, find_near_duplicate
+from journal_club_bot.models import Categories, MessageFingerprint, ParsedMessage, Services
+from journal_club_bot.planner import execute_plan, format_plan, plan_run
+from journal_club_bot.storage import MessageEventMap, StateStore, _write_json_atomic, open_state_store
+
+HEARTBEAT_TIMEOUT_SECONDS = 10
+# Last heartbeat of a --poll worker, reported by /healthz and --health
+HEARTBEAT_PATH = Path("state/heartbeat.json")
+# How often a running cycle refreshes its heartbeat
+HEARTBEAT_RUNNING_SECONDS = 60
+# Slack on top of the announced gap before a heartbeat counts as stale
+HEARTBEAT_GRACE_SECONDS = 300
+
+SETTINGS_PATH = Path("config/settings.yml")
+CATEGORIES_PATH = Path("config/categories.yml")
+
+# Imported lazily by the modules that use them; warm_up() loads them ahead of the first run
+HEAVY_MODULES = (
+    "yaml",
+    "dateparser",
+    "bs4",
+    "lxml.etree",
+    "httplib2",
+    "google_auth_httplib2",
+    "google.auth.transport.requests",
+    "google.oauth2.credentials",
+    "google.oauth2.service_account",
+    "google_auth_oauthlib.flow",
+    "googleapiclient.discovery",
 )
-from journal_club_bot.storage import StateStore, MessageEventMap
 
 def setup_logging() -> None:
     log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
     logging.basicConfig(level=log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-def run_once() -> None:
+@dataclass
+class _Resident:
+    """What a resident worker keeps between cycles besides the process-wide API clients"""
+    state: Optional[StateStore] = None
+    cache: Optional[EventWindowCache] = None
+
+def run_once(plan_only: bool = False, resident: Optional[_Resident] = None) -> Dict[str, Any]:
+    """Run one poll cycle; returns seconds per stage, message and operation counts and API usage"""
+    setup_logging()
+    EXECUTOR.reset_stats()
+    report: Dict[str, Any] = {"timings": {}, "counts": {}}
+    start = time.perf_counter()
+    try:
+        _process_new_messages(plan_only, report["timings"], report["counts"], resident)
+    finally:
+        report["timings"]["total"] = time.perf_counter() - start
+        report["api"] = EXECUTOR.stats()
+        logging.info(f"API usage: {report['api']}")
+        logging.info("Run stages: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in report["timings"].items()))
+        logging.info(f"Run counts: {report['counts']}")
+    return report
+
+def _load_category_index(categories_path: Path) -> Categories:
+    categories = load_categories(categories_path)
+    build_category_index(categories)
+    return categories
+
+def _bootstrap(settings_path: Path, categories_path: Path) -> Tuple[Services, Categories]:
+    """
+    Start the network-bound credential and client setup and, while it waits, load the
+    category index and warm the parser. Logs the seconds spent in each phase.
+    """
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="bootstrap") as pool:
+        services = pool.submit(get_authorized_services, timings=timings)
+        categories = pool.submit(timed, timings, "category_index", _load_category_index, categories_path)
+        warm = pool.submit(timed, timings, "parser_warm_up", warm_up_parser, settings_path)
+        services, categories = services.result(), categories.result()
+        try:
+            warm.result()
+        except Exception as e:
+            logging.warning(f"Parser warm-up failed: {e}")
+    timings["total"] = time.perf_counter() - start
+    logging.info("Bootstrap: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items()))
+    return services, categories
+
+def _import_heavy_modules() -> None:
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+def warm_up(local: bool = True, clients: bool = True) -> Dict[str, float]:
+    """
+    Pay startup costs before the first run. The local phases (imports, category index,
+    parser regexes) are fork-safe and can run in a gunicorn master with preload; the client
+    phase opens network and gRPC state, so it belongs in each worker.
+    """
     setup_logging()
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    if local:
+        timed(timings, "imports", _import_heavy_modules)
+        timed(timings, "category_index", _load_category_index, CATEGORIES_PATH)
+        try:
+            timed(timings, "parser_warm_up", warm_up_parser, SETTINGS_PATH)
+        except Exception as e:
+            logging.warning(f"Parser warm-up failed: {e}")
+    if clients:
+        get_authorized_services(timings=timings)
+    timings["total"] = time.perf_counter() - start
+    logging.info("Warm-up: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items()))
+    return timings
+
+def _process_new_messages(plan_only: bool, timings: Dict[str, float], counts: Dict[str, int], resident: Optional[_Resident] = None) -> None:
     Path("tokens").mkdir(parents=True, exist_ok=True)
     Path("state").mkdir(parents=True, exist_ok=True)
     Path("config").mkdir(parents=True, exist_ok=True)
 
-    settings_path = Path("config/settings.yml")
-    categories_path = Path("config/categories.yml")
+    settings_path = SETTINGS_PATH
+    categories_path = CATEGORIES_PATH
 
-    services = get_authorized_services()
+    services, categories = timed(timings, "bootstrap", _bootstrap, settings_path, categories_path)
     gmail = services.gmail
     calendar = services.calendar
 
-    categories = load_categories(categories_path)
-    state = StateStore("state")
+    resident = resident or _Resident()
+    if resident.state is None:
+        resident.state = open_state_store("state")
+    state = resident.state
 
-    ensure_category_calendars(calendar, categories, state)
+    # All state is loaded once and written back at checkpoints and when the run ends
+    with state.session():
+        cal_map = timed(timings, "calendars", ensure_category_calendars, calendar, categories, state, create_missing=not plan_only)
 
-    messages = fetch_labeled_messages(gmail, settings_path, state)
-    if not messages:
-        logging.info("No new messages to process.")
-        return
+        messages = timed(timings, "list_messages", fetch_labeled_messages, gmail, settings_path, state)
+        counts["messages"] = len(messages)
+        if not messages:
+            logging.info("No new messages to process.")
+            if not plan_only:
+                timed(timings, "prune", state.prune)
+            return
 
-    for msg in messages:
-        msg_id = msg["id"]
-        if state.is_processed(msg_id):
-            continue
-        subject, body_text, html, attachments = extract_message_payload(gmail, msg_id)
-        parsed = parse_event_from_text(subject, body_text, html, settings_path, attachments)
-        if not parsed:
-            state.mark_processed(msg_id, MessageEventMap(message_id=msg_id, category_to_event_ids={}))
+        if resident.cache is None or resident.cache.calendar is not calendar or resident.cache.state is not state:
+            resident.cache = EventWindowCache(calendar, state)
+        else:
+            resident.cache.refresh()
+        cache = resident.cache
+        ctx = _RunContext(gmail, calendar, categories, cal_map, state, cache, settings_path, timings, counts)
+
+        pending_ids = [msg["id"] for msg in messages if not state.is_processed(msg["id"])]
+        counts["pending"] = len(pending_ids)
+        if plan_only:
+            _process_batch(ctx, pending_ids, plan_only=True)
+            return
+
+        # Workers sharing the state lease batches of messages, so concurrent runs split the backlog
+        cfg = state.load_settings()
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        lease_seconds = float(cfg.get("claim_lease_seconds", 600))
+        batch_size = int(cfg.get("claim_batch_size", 25))
+        while True:
+            claimed = state.claim(pending_ids, owner, lease_seconds, limit=batch_size)
+            if not claimed:
+                break
+            logging.info(f"Claimed {len(claimed)} messages as {owner}")
+            _count(counts, "claimed", len(claimed))
+            failed, flushed = list(claimed), False
+            try:
+                failed = _process_batch(ctx, claimed)
+                flushed = True
+            finally:
+                # Once the batch is flushed claim() sees its processed messages, so every lease can go;
+                # after an error only the unprocessed ones go back to the pool
+                state.release(claimed if flushed else [m for m in failed if not state.is_processed(m)], owner)
+            done = set(claimed)
+            pending_ids = [m for m in pending_ids if m not in done]
+
+        timed(timings, "prune", state.prune)
+
+def _count(counts: Dict[str, int], key: str, amount: int = 1) -> None:
+    counts[key] = counts.get(key, 0) + amount
+
+@dataclass
+class _RunContext:
+    gmail: Any
+    calendar: Any
+    categories: Categories
+    cal_map: Dict[str, str]
+    state: StateStore
+    cache: EventWindowCache
+    settings_path: Path
+    timings: Dict[str, float] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    fingerprints: Optional[Dict[str, MessageFingerprint]] = None
+
+def _process_batch(ctx: _RunContext, message_ids: List[str], plan_only: bool = False) -> List[str]:
+    """Parse, plan and apply one batch of messages; returns the IDs that failed and stay unprocessed"""
+    state = ctx.state
+    near_dup_threshold = int(state.load_settings().get("near_duplicate_threshold", 3))
+    if ctx.fingerprints is None:
+        ctx.fingerprints = state.load_fingerprints()
+    fingerprints = ctx.fingerprints
+
+    # Parse every message first, then reconcile the whole batch against the calendars at once
+    parsed_messages = []
+    start = time.perf_counter()
+    for msg_id, payload in iter_message_payloads(ctx.gmail, message_ids, ctx.settings_path):
+        subject, body_text, html, attachments = payload
+
+        # Cross-posted copies of an already-processed announcement reuse its event mapping.
+        # Only plain announcements short-circuit; the type is part of the fingerprint, so an
+        # update or cancellation never matches the announcement it changes.
+        email_type = detect_email_type(subject, body_text, html)
+        fp = fingerprint_message(subject, body_text or html or "", email_type)
+        if near_dup_threshold > 0 and email_type == "new":
+            dup_id = find_near_duplicate(fp, fingerprints, near_dup_threshold)
+            dup_mapping = state.load_mapping(dup_id) if dup_id else None
+            if dup_mapping is not None:
+                logging.info(f"Message {msg_id} is a near-duplicate of {dup_id}, reusing its events")
+                if plan_only:
+                    continue
+                for cal_id, event_id in state.load_event_refs(dup_id).items():
+                    state.save_event_ref(msg_id, cal_id, event_id)
+                state.mark_processed(msg_id, MessageEventMap(message_id=msg_id, category_to_event_ids=dict(dup_mapping)))
+                _count(ctx.counts, "near_duplicates")
+                continue
+        if not plan_only:
+            fingerprints[msg_id] = fp
+            state.save_fingerprint(msg_id, fp)
+
+        parsed = parse_event_from_text(subject, body_text, html, ctx.settings_path, attachments)
+        parsed_messages.append(ParsedMessage(message_id=msg_id, subject=subject, event=parsed))
+        _count(ctx.counts, "parsed" if parsed is not None else "unparsed")
+    ctx.timings["fetch_and_parse"] = ctx.timings.get("fetch_and_parse", 0.0) + time.perf_counter() - start
+
+    plan = timed(ctx.timings, "plan", plan_run, parsed_messages, ctx.categories, ctx.cal_map, state, ctx.cache)
+    for op in plan.operations:
+        _count(ctx.counts, f"operations_{op.kind}")
+    if plan_only:
+        print(format_plan(plan))
+        return []
+
+    # Checkpoint: fingerprints and near-duplicate mappings
+    state.flush()
+    logging.info(format_plan(plan).splitlines()[0])
+    results = timed(ctx.timings, "execute", execute_plan, plan, ctx.calendar, state, ctx.cache)
+    # Checkpoint: event refs and mirrors of the writes that went through
+    state.flush()
+
+    failed = []
+    for msg in parsed_messages:
+        mapping = results[msg.message_id]
+        if mapping.failed_categories:
+            # Leave the message unprocessed so the next run retries it; refs keep the retry idempotent
+            logging.warning(f"Message {msg.message_id} failed for {mapping.failed_categories}, will retry next run")
+            failed.append(msg.message_id)
             continue
+        if msg.event is not None:
+            mapping.event_end = msg.event.end
+        state.mark_processed(msg.message_id, mapping)
+        _count(ctx.counts, "processed")
+    state.flush()
+    _count(ctx.counts, "failed", len(failed))
+    return failed
 
-        # Handle different types of emails
-        if parsed.email_type in ["update", "cancellation", "reminder"]:
-            # Handle updates to existing events
-            mapping = handle_event_update(calendar, categories, parsed, msg_id, state)
-            state.mark_processed(msg_id, mapping)
-        else:
-            # Handle new events
-            combined_text = f"{subject}\n\n{parsed.title}\n\n{parsed.abstract or ''}"
-            category_names = categorize_text(categories, combined_text)
-            if not category_names and categories.fallback_category:
-                category_names = [categories.fallback_category]
 
-            mapping = upsert_event_to_calendars(calendar, categories, category_names, parsed, msg_id, state)
-            state.mark_processed(msg_id, mapping)
+def _send_heartbeat(url: Optional[str], payload: Dict[str, Any]) -> None:
+    """Record the heartbeat in HEARTBEAT_PATH and POST it to url when one is configured"""
+    payload = {**payload, "at": time.time()}
+    try:
+        HEARTBEAT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _write_json_atomic(HEARTBEAT_PATH, payload)
+    except OSError as e:
+        logging.warning(f"Could not record heartbeat in {HEARTBEAT_PATH}: {e}")
+    if not url:
+        return
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=HEARTBEAT_TIMEOUT_SECONDS):
+            pass
+    except Exception as e:
+        logging.warning(f"Heartbeat to {url} failed: {e}")
+
+def heartbeat_health(heartbeat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The heartbeat with its age; it is stale once the next heartbeat it announced
+    (next_heartbeat_seconds) is overdue by more than HEARTBEAT_GRACE_SECONDS.
+    """
+    age = time.time() - heartbeat.get("at", 0)
+    return {**heartbeat, "age_seconds": round(age),
+            "stale": age > heartbeat.get("next_heartbeat_seconds", 0) + HEARTBEAT_GRACE_SECONDS}
 
-            if parsed.cancelled:
-                delete_event_from_calendars(calendar, mapping)
+def poller_health() -> Optional[Dict[str, Any]]:
+    """Last heartbeat recorded by a --poll worker in this state directory, or None if there is none"""
+    try:
+        heartbeat = json.loads(HEARTBEAT_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return heartbeat_health(heartbeat)
 
+def poll_forever() -> None:
+    """
+    Resident worker for --poll: runs a cycle every poll_interval_seconds (+/- poll_jitter_seconds)
+    and keeps API clients, the state store and calendar mirrors in memory between cycles.
+    Cycles without new mail (or that fail) double the interval up to poll_max_interval_seconds;
+    new mail resets it. A heartbeat is recorded (and sent to heartbeat_url) every
+    HEARTBEAT_RUNNING_SECONDS while a cycle runs, after each cycle and at least once per base
+    interval while waiting. SIGTERM or SIGINT stops the worker after the current cycle.
+    """
+    stop = threading.Event()
+
+    def request_stop(signum, frame) -> None:
+        logging.info(f"Received signal {signum}, stopping after the current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    try:
+        warm_up()
+    except Exception as e:
+        # Each cycle bootstraps what is still missing
+        logging.warning(f"Warm-up failed: {e}")
+    resident = _Resident(state=open_state_store("state"))
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    interval = None
+    cycle = 0
+    while not stop.is_set():
+        cfg = resident.state.load_settings()
+        base = float(cfg.get("poll_interval_seconds", 600))
+        jitter = float(cfg.get("poll_jitter_seconds", 60))
+        ceiling = max(base, float(cfg.get("poll_max_interval_seconds", 3600)))
+        heartbeat_url = os.environ.get("JC_HEARTBEAT_URL") or cfg.get("heartbeat_url")
+
+        cycle += 1
+        status, report = "ok", None
+        running = {"worker": worker, "cycle": cycle, "status": "running", "started_at": time.time(),
+                   "next_heartbeat_seconds": HEARTBEAT_RUNNING_SECONDS}
+        _send_heartbeat(heartbeat_url, running)
+        cycle_done = threading.Event()
+
+        def keep_alive(url=heartbeat_url, running=running, cycle_done=cycle_done) -> None:
+            # Long cycles must not look like a wedged worker
+            while not cycle_done.wait(HEARTBEAT_RUNNING_SECONDS):
+                _send_heartbeat(url, running)
+
+        ticker = threading.Thread(target=keep_alive, name="heartbeat", daemon=True)
+        ticker.start()
+        try:
+            report = run_once(resident=resident)
+        except Exception as e:
+            logging.exception(f"Poll cycle {cycle} failed")
+            status = f"error: {type(e).__name__}: {e}"
+        finally:
+            cycle_done.set()
+            ticker.join()
+        new_mail = report is not None and report["counts"].get("pending", 0) > 0
+        interval = base if new_mail or interval is None else min(ceiling, interval * 2)
+        delay = max(0.0, interval + random.uniform(-jitter, jitter))
+
+        heartbeat = {"worker": worker, "cycle": cycle, "status": status, "next_poll_seconds": round(delay),
+                     "next_heartbeat_seconds": round(min(base, delay))}
+        if report is not None:
+            heartbeat.update(counts=report["counts"], seconds=round(report["timings"]["total"], 2))
+        _send_heartbeat(heartbeat_url, heartbeat)
+        logging.info(f"Cycle {cycle} {status}; next poll in {delay:.0f}s")
+
+        # Wait in slices of the base interval so heartbeats keep coming while backed off
+        deadline = time.monotonic() + delay
+        while not stop.wait(max(0.0, min(base, deadline - time.monotonic()))):
+            if time.monotonic() >= deadline:
+                break
+            remaining = deadline - time.monotonic()
+            _send_heartbeat(heartbeat_url, {"worker": worker, "cycle": cycle, "status": "waiting", "next_poll_seconds": round(remaining),
+                                             "next_heartbeat_seconds": round(min(base, remaining))})
+    logging.info("Poller stopped")
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--once", action="store_true", help="Run once and exit")
-    parser.add_argument("--poll", action="store_true", help="Run once (for scheduler)")
-    _ = parser.parse_args()
-    run_once()
+    parser.add_argument("--poll", action="store_true", help="Run as a resident worker that polls on an interval until SIGTERM")
+    parser.add_argument("--plan", action="store_true", help="Print the planned calendar changes without applying them")
+    parser.add_argument("--health", action="store_true", help="Print the poller's last heartbeat; exit 1 if it is missing or stale")
+    args = parser.parse_args()
+    if args.health:
+        health = poller_health()
+        print(json.dumps(health, indent=2))
+        raise SystemExit(0 if health is not None and not health["stale"] else 1)
+    if args.poll and not args.plan:
+        setup_logging()
+        poll_forever()
+        return
+    run_once(plan_only=args.plan)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
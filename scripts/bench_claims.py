@@ -0,0 +1,77 @@
+"""
+Benchmark lease-based work splitting across worker processes.
+
+Each worker process opens the same state store, repeatedly claims a batch of
+unprocessed messages, "processes" each one (a sleep standing in for the
+Gmail and Calendar round trips) and marks it processed. Reports wall time
+per worker count and checks that no message was processed twice.
+
+Usage: python scripts/bench_claims.py [--messages 400] [--workers 1 2 4 8] [--backend sqlite]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from journal_club_bot.models import MessageEventMap  # noqa: E402
+from journal_club_bot.sqlite_store import SQLiteStateStore  # noqa: E402
+from journal_club_bot.storage import StateStore  # noqa: E402
+
+def open_store(backend: str, base: str):
+    return SQLiteStateStore(base) if backend == "sqlite" else StateStore(base)
+
+def worker(backend: str, base: str, ids, batch: int, latency: float):
+    store = open_store(backend, base)
+    owner = f"worker-{os.getpid()}"
+    done = []
+    while True:
+        claimed = store.claim(ids, owner, lease_seconds=60, limit=batch)
+        if not claimed:
+            return done
+        # One session per batch, as main.py does: marks are written at the batch checkpoint
+        with store.session():
+            for message_id in claimed:
+                time.sleep(latency)
+                store.mark_processed(message_id, MessageEventMap(message_id=message_id, category_to_event_ids={}))
+                done.append(message_id)
+
+def run(backend: str, workers: int, n: int, batch: int, latency: float):
+    ids = [f"msg{i:06d}" for i in range(n)]
+    with tempfile.TemporaryDirectory() as base:
+        store = open_store(backend, base)
+        if backend == "sqlite":
+            store.close()
+        # Spawned, not forked: workers must not inherit the parent's SQLite handles
+        ctx = multiprocessing.get_context("spawn")
+        t0 = time.perf_counter()
+        with ctx.Pool(workers) as pool:
+            results = pool.starmap(worker, [(backend, base, ids, batch, latency)] * workers)
+        elapsed = time.perf_counter() - t0
+    counts = Counter(m for done in results for m in done)
+    duplicates = sum(1 for c in counts.values() if c > 1)
+    return elapsed, len(counts), duplicates
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=400)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--batch", type=int, default=10)
+    ap.add_argument("--latency-ms", type=float, default=20)
+    ap.add_argument("--backend", choices=["sqlite", "json"], default="sqlite")
+    args = ap.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        elapsed, processed, duplicates = run(args.backend, workers, args.messages, args.batch, args.latency_ms / 1000)
+        baseline = baseline or elapsed
+        print(f"{workers} workers: {elapsed:6.2f} s, {args.messages / elapsed:7.1f} msg/s, "
+              f"speedup {baseline / elapsed:4.1f}x, processed {processed}/{args.messages}, duplicates {duplicates}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark cold-start cost of the web service.
+
+Each measurement runs in a fresh interpreter from the repository root:
+- import:        `import server`, what a gunicorn master pays before warm-up
+- warm_up:       the fork-safe warm-up phases (imports, category index, parser)
+- first_parse:   the first parse of an announcement in a process without warm-up
+- warmed_parse:  the same parse after warm-up, i.e. what the first request pays
+
+With --clients the warm-up also builds the authorized Gmail and Calendar
+clients, which needs credentials (see README).
+
+Usage: python scripts/bench_cold_start.py [--repeat 5] [--clients]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SAMPLE = (
+    "'Journal Club: Single-cell atlas of the aging hippocampus', "
+    "'Speaker: Dr. John Roe\\nDate: Thursday, October 2, 2025 4:00 PM\\nLocation: Room 204', "
+    "'<p>Abstract: We map transcriptional changes across the lifespan.</p>'"
+)
+
+PROGRAMS = {
+    "import": """
+import sys, time
+t = time.perf_counter()
+import server
+heavy = [m for m in ("yaml", "dateparser", "bs4", "googleapiclient") if m in sys.modules]
+result = {"seconds": time.perf_counter() - t, "heavy_modules_loaded": heavy}
+""",
+    "warm_up": """
+import time
+from main import warm_up
+t = time.perf_counter()
+phases = warm_up(local=True, clients=CLIENTS)
+result = {"seconds": time.perf_counter() - t, "phases": phases}
+""",
+    "first_parse": """
+import time
+from main import SETTINGS_PATH
+from journal_club_bot.parser import parse_event_from_text
+t = time.perf_counter()
+try:
+    parse_event_from_text(SAMPLE, SETTINGS_PATH)
+except Exception:
+    pass
+result = {"seconds": time.perf_counter() - t}
+""",
+    "warmed_parse": """
+import time
+from main import SETTINGS_PATH, warm_up
+from journal_club_bot.parser import parse_event_from_text
+warm_up(local=True, clients=False)
+t = time.perf_counter()
+try:
+    parse_event_from_text(SAMPLE, SETTINGS_PATH)
+except Exception:
+    pass
+result = {"seconds": time.perf_counter() - t}
+""",
+}
+
+def measure(name: str, clients: bool) -> dict:
+    program = (
+        "import json, logging\nlogging.disable(logging.CRITICAL)\n"
+        + PROGRAMS[name].replace("SAMPLE", SAMPLE).replace("CLIENTS", str(clients))
+        + "\nprint(json.dumps(result))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", program], cwd=ROOT, capture_output=True, text=True)
+    if out.returncode != 0:
+        sys.exit(f"{name} failed:\n{out.stderr.strip().splitlines()[-1]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--clients", action="store_true", help="Include building the authorized API clients")
+    args = ap.parse_args()
+
+    for name in PROGRAMS:
+        runs = [measure(name, args.clients) for _ in range(args.repeat)]
+        median = statistics.median(r["seconds"] for r in runs)
+        line = f"{name:13s} median {median * 1000:8.1f} ms over {args.repeat} runs"
+        if "heavy_modules_loaded" in runs[0]:
+            line += f", heavy modules loaded: {runs[0]['heavy_modules_loaded'] or 'none'}"
+        print(line)
+        if "phases" in runs[0]:
+            for phase in runs[0]["phases"]:
+                seconds = statistics.median(r["phases"][phase] for r in runs)
+                print(f"  {phase:20s} {seconds * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
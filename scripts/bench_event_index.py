@@ -0,0 +1,128 @@
+"""
+Benchmark existing-event matching against a large calendar.
+
+Compares a full linear scoring scan with index-based candidate retrieval
+over a synthetic calendar, and checks both pick the same best match. A
+second set of lookups carries only a date and a location that contains the
+event's room ("Room 101, Building A"), which matches on date and location
+alone; there both must reach the same best score.
+
+Usage: python scripts/bench_event_index.py [--events 10000] [--lookups 200]
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from journal_club_bot.calendar_client import score_event  # noqa: E402
+from journal_club_bot.event_index import EventIndex  # noqa: E402
+from journal_club_bot.models import ParsedEvent  # noqa: E402
+
+WORDS = (
+    "neural circuit dynamics protein folding immune response tumor microenvironment "
+    "single cell atlas chromatin remodeling synaptic plasticity metabolic signaling "
+    "gene regulation stem cell niche viral entry bacterial persistence cortical "
+    "oscillations membrane transport kinase cascade genome editing lineage tracing"
+).split()
+SURNAMES = [f"surname{i}" for i in range(2000)]
+ROOMS = [f"Room {i}" for i in range(100, 160)]
+
+def make_events(n: int, rng: random.Random):
+    base = datetime.now(timezone.utc) - timedelta(days=60)
+    events = []
+    for i in range(n):
+        start = base + timedelta(minutes=rng.randrange(0, 120 * 24 * 60, 30))
+        title = " ".join(rng.sample(WORDS, 6)) + f" {i}"
+        speaker = f"Dr. First {rng.choice(SURNAMES)}"
+        events.append({
+            "id": f"evt{i}",
+            "summary": title,
+            "description": f"Abstract about {title}.\n\nSpeaker: {speaker}\n\nLocation: {rng.choice(ROOMS)}",
+            "location": rng.choice(ROOMS),
+            "start": {"dateTime": start.isoformat()},
+        })
+    return events
+
+def linear_best(entries, pe):
+    best = None
+    for entry in entries:
+        score = score_event(pe, entry)
+        if score >= 50 and (best is None or score > best[1]):
+            best = (entry.event_id, score)
+    return best
+
+def indexed_best(index, pe):
+    best = None
+    for entry in index.candidates(pe):
+        score = score_event(pe, entry)
+        if score >= 50 and (best is None or score > best[1]):
+            best = (entry.event_id, score)
+    return best
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=10000)
+    ap.add_argument("--lookups", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    events = make_events(args.events, rng)
+
+    t0 = time.perf_counter()
+    index = EventIndex(events)
+    build_s = time.perf_counter() - t0
+
+    queries = []
+    for event in rng.sample(events, args.lookups):
+        entry = index.entries[event["id"]]
+        queries.append(ParsedEvent(
+            title=entry.summary,
+            start=entry.start + timedelta(hours=rng.choice([0, 2, 26])),
+            end=entry.start + timedelta(hours=1),
+            timezone="UTC",
+            speaker=entry.description_lower.split("speaker: ")[1].split("\n")[0].title(),
+            location=event["location"],
+        ))
+
+    entries = list(index.entries.values())
+    t0 = time.perf_counter()
+    linear = [linear_best(entries, pe) for pe in queries]
+    linear_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    indexed = [indexed_best(index, pe) for pe in queries]
+    indexed_s = time.perf_counter() - t0
+
+    scored = sum(len(index.candidates(pe)) for pe in queries) / len(queries)
+    agree = sum(1 for a, b in zip(linear, indexed) if a == b)
+
+    location_queries = []
+    for event in rng.sample(events, args.lookups):
+        entry = index.entries[event["id"]]
+        location_queries.append(ParsedEvent(
+            title="Journal Club",
+            start=entry.start,
+            end=entry.start + timedelta(hours=1),
+            timezone="UTC",
+            location=f"{event['location']}, Building A",
+        ))
+    # Several events can share a day and room, so ties are compared by score
+    location_agree = sum(
+        1 for pe in location_queries
+        if (linear_best(entries, pe) or (None, None))[1] == (indexed_best(index, pe) or (None, None))[1]
+    )
+
+    print(f"events: {args.events}, lookups: {args.lookups}")
+    print(f"index build: {build_s * 1000:.1f} ms")
+    print(f"linear scan: {linear_s / len(queries) * 1000:.2f} ms/lookup")
+    print(f"indexed:     {indexed_s / len(queries) * 1000:.2f} ms/lookup ({scored:.1f} candidates scored on average)")
+    print(f"speedup:     {linear_s / indexed_s:.1f}x, same best match: {agree}/{len(queries)}")
+    print(f"location-only lookups, same best score: {location_agree}/{len(location_queries)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark processed-message bookkeeping of the JSON and SQLite state backends.
+
+Fills each backend with N processed messages, then times is_processed lookups
+and mark_processed writes. The JSON backend re-reads (and rewrites) the whole
+processed.json on every call, so its cost grows with history size; SQLite
+stays flat.
+
+Usage: python scripts/bench_state_store.py [--sizes 1000 10000 100000] [--ops 200]
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from journal_club_bot.models import MessageEventMap  # noqa: E402
+from journal_club_bot.sqlite_store import SQLiteStateStore  # noqa: E402
+from journal_club_bot.storage import StateStore  # noqa: E402
+
+def seed_json(base: Path, n: int) -> StateStore:
+    base.mkdir(parents=True)
+    processed = {f"msg{i:08d}": ({"Journal Club – Neuro": f"evt{i}"} if i % 3 == 0 else {}) for i in range(n)}
+    (base / "processed.json").write_text(json.dumps(processed, indent=2), encoding="utf-8")
+    (base / "event_refs.json").write_text("{}", encoding="utf-8")
+    return StateStore(str(base))
+
+def seed_sqlite(base: Path, n: int) -> SQLiteStateStore:
+    # Seeding through the JSON migration also measures the one-time import
+    seed_json(base, n)
+    t0 = time.perf_counter()
+    store = SQLiteStateStore(str(base))
+    print(f"  sqlite migration of {n} messages: {(time.perf_counter() - t0) * 1000:.0f} ms")
+    return store
+
+def time_ops(store, n: int, ops: int):
+    ids = [f"msg{(i * 7919) % n:08d}" for i in range(ops)] + [f"new{i}" for i in range(ops)]
+    t0 = time.perf_counter()
+    for message_id in ids:
+        store.is_processed(message_id)
+    lookup = (time.perf_counter() - t0) / len(ids)
+
+    t0 = time.perf_counter()
+    for i in range(ops):
+        store.mark_processed(f"new{i}", MessageEventMap(message_id=f"new{i}", category_to_event_ids={}))
+    write = (time.perf_counter() - t0) / ops
+    return lookup, write
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--ops", type=int, default=200)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            print(f"{n} processed messages:")
+            for name, seed in (("json", seed_json), ("sqlite", seed_sqlite)):
+                store = seed(Path(tmp) / f"{name}-{n}", n)
+                # Keep the JSON backend's run time bounded at large sizes
+                ops = args.ops if name == "sqlite" else max(5, min(args.ops, 2_000_000 // n))
+                lookup, write = time_ops(store, n, ops)
+                print(f"  {name:6} is_processed: {lookup * 1e6:9.1f} us   mark_processed: {write * 1e6:9.1f} us")
+
+if __name__ == "__main__":
+    main()
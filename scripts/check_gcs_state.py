@@ -0,0 +1,75 @@
+"""
+Exercise the GCS state backend against a local fake GCS server.
+
+Two stores with separate local caches share one state object and write
+concurrently; the generation-match conflict must be merged, not lost.
+Message leases must be deleted on release, expired ones swept by the next
+claim, and a message processed elsewhere must not be handed out again.
+
+    docker run -d -p 4443:4443 fsouza/fake-gcs-server -scheme http
+    STORAGE_EMULATOR_HOST=http://localhost:4443 python scripts/check_gcs_state.py
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from journal_club_bot.gcs_store import GCSStateStore, _storage_client  # noqa: E402
+from journal_club_bot.models import MessageEventMap  # noqa: E402
+
+BUCKET = "jc-state-test"
+OBJECT = "journal-club-bot/state.json"
+
+def mapping(message_id: str) -> MessageEventMap:
+    return MessageEventMap(message_id=message_id, category_to_event_ids={"Journal Club – Neuro": f"evt-{message_id}"})
+
+def main() -> None:
+    if not os.environ.get("STORAGE_EMULATOR_HOST"):
+        sys.exit("Set STORAGE_EMULATOR_HOST to a fake GCS server, e.g. http://localhost:4443")
+    client = _storage_client()
+    bucket = client.lookup_bucket(BUCKET) or client.create_bucket(BUCKET)
+    for blob in bucket.list_blobs(prefix=OBJECT):
+        blob.delete()
+
+    with tempfile.TemporaryDirectory() as dir_a, tempfile.TemporaryDirectory() as dir_b:
+        a = GCSStateStore(dir_a, BUCKET, OBJECT)
+        b = GCSStateStore(dir_b, BUCKET, OBJECT)
+
+        # b reads state, then a writes before b's upload: b must hit a generation conflict and merge
+        with b.session():
+            b.mark_processed("m2", mapping("m2"))
+            with a.session():
+                a.mark_processed("m1", mapping("m1"))
+                a.save_event_ref("m1", "cal-neuro", "evt-m1")
+        with a.session():
+            a.remove_event_ref("m1", "cal-neuro")
+
+        # b has not seen m3 processed by a: its fresh lease must be dropped, not handed out
+        a.claim(["m3"], "a", 60)
+        with a.session():
+            a.mark_processed("m3", mapping("m3"))
+        a.release(["m3"], "a")
+        b_claimed = b.claim(["m3", "m4"], "b", 60)
+        b.release(b_claimed, "b")
+        a.claim(["m5"], "a", -1)
+        b.claim([], "b", 60)
+        leases = [blob.name for blob in bucket.list_blobs(prefix=f"{OBJECT}.claims/")]
+
+        with tempfile.TemporaryDirectory() as dir_c:
+            c = GCSStateStore(dir_c, BUCKET, OBJECT)
+            checks = {
+                "processed message not reclaimed": b_claimed == ["m4"],
+                "released and expired leases deleted": leases == [],
+                "m1 processed": c.is_processed("m1"),
+                "m2 processed": c.is_processed("m2"),
+                "m1 ref removed": c.load_event_refs("m1") == {},
+                "mappings kept": c.load_mapping("m2") == mapping("m2").category_to_event_ids,
+            }
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Check the one-time import of a JSON state directory into the SQLite backend.
+
+A JSON store processes two messages and prunes one of them into an archive
+segment; the other's event is still upcoming. After opening the directory
+with the SQLite backend the pruned message must still count as processed,
+and a forced prune must keep the upcoming one because its event end came
+across with retention.json.
+
+Usage: python scripts/check_sqlite_migration.py
+"""
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from journal_club_bot.models import MessageEventMap  # noqa: E402
+from journal_club_bot.sqlite_store import SQLiteStateStore  # noqa: E402
+from journal_club_bot.storage import StateStore  # noqa: E402
+
+def mapping(message_id: str, event_end: datetime) -> MessageEventMap:
+    return MessageEventMap(
+        message_id=message_id,
+        category_to_event_ids={"Journal Club – Neuro": f"evt-{message_id}"},
+        event_end=event_end,
+    )
+
+def main() -> None:
+    now = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory() as base:
+        settings = Path(base) / "settings.yml"
+        # No lookback or grace: only the event end keeps a processed message out of the archive
+        settings.write_text("lookback_days: 0\nretention_grace_days: 0\n", encoding="utf-8")
+
+        json_store = StateStore(base)
+        json_store.settings_path = settings
+        json_store.mark_processed("past", mapping("past", now - timedelta(days=30)))
+        json_store.mark_processed("upcoming", mapping("upcoming", now + timedelta(days=30)))
+        pruned = json_store.prune(force=True)
+
+        sqlite_store = SQLiteStateStore(base)
+        sqlite_store.settings_path = settings
+        migrated = {
+            "past": sqlite_store.is_processed("past"),
+            "upcoming": sqlite_store.is_processed("upcoming"),
+        }
+        report = sqlite_store.prune(force=True)
+        checks = {
+            "JSON store archived the past message": pruned is not None and pruned["archived"] == 1,
+            "archived message still processed": migrated["past"],
+            "processed message imported": migrated["upcoming"],
+            "mapping imported": sqlite_store.load_mapping("upcoming") == {"Journal Club – Neuro": "evt-upcoming"},
+            "event end kept the upcoming message": report["archived"] == 0 and sqlite_store.is_processed("upcoming"),
+        }
+        sqlite_store.close()
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,82 @@
-﻿from flask import Flask, jsonify
-from main import run_once
+﻿import logging
+import threading
+import time
+
+from flask import Flask, jsonify, request
+from journal_club_bot.jobs import RunJobs
+from main import heartbeat_health, poller_health, run_once, warm_up
 
 app = Flask(__name__)
 
+# Runs execute in the background, one at a time; overlapping triggers join the in-flight run
+_jobs = RunJobs(run_once)
+
+# Set once warm-up has finished; /readyz gates traffic on it while /healthz only reports liveness
+_ready = threading.Event()
+
+# Last heartbeat POSTed by each --poll worker (heartbeat_url pointing at /healthz); workers
+# silent for longer than HEARTBEAT_RETENTION_SECONDS are forgotten
+HEARTBEAT_RETENTION_SECONDS = 24 * 3600
+_heartbeats = {}
+_heartbeats_lock = threading.Lock()
+
+def start_warm_up(local: bool = True) -> threading.Thread:
+    """Run warm-up in the background and flip readiness when it finishes"""
+    def work() -> None:
+        try:
+            warm_up(local=local, clients=True)
+        except Exception:
+            # Runs build their clients on demand, so a failed warm-up only costs latency
+            logging.exception("Warm-up failed")
+        _ready.set()
+
+    thread = threading.Thread(target=work, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
 @app.get("/healthz")
 def health():
-    return "ok", 200
+    # Pollers are reported, but never fail the web service's own liveness
+    with _heartbeats_lock:
+        pollers = {worker: heartbeat_health(heartbeat) for worker, heartbeat in _heartbeats.items()}
+    local = poller_health()
+    if local is not None:
+        pollers.setdefault(local.get("worker", "local"), local)
+    if not pollers:
+        return "ok", 200
+    return jsonify(status="ok", pollers=pollers), 200
+
+@app.post("/healthz")
+def record_heartbeat():
+    heartbeat = request.get_json(silent=True)
+    if not isinstance(heartbeat, dict):
+        return jsonify({"error": "expected a JSON object"}), 400
+    # Aged by this server's clock, so skew between hosts does not make a poller look stale
+    heartbeat["at"] = now = time.time()
+    with _heartbeats_lock:
+        for worker in [w for w, hb in _heartbeats.items() if now - hb["at"] > HEARTBEAT_RETENTION_SECONDS]:
+            del _heartbeats[worker]
+        _heartbeats[str(heartbeat.get("worker", request.remote_addr))] = heartbeat
+    return "", 204
+
+@app.get("/readyz")
+def ready():
+    if not _ready.is_set():
+        return "warming up", 503
+    return "ready", 200
 
 @app.post("/run")
 def run():
-    run_once()
-    return jsonify({"status": "ok"}), 200
+    job, coalesced = _jobs.submit()
+    return jsonify({"job_id": job["id"], "status": job["status"], "coalesced": coalesced, "status_url": f"/runs/{job['id']}"}), 202
+
+@app.get("/runs/<job_id>")
+def run_status(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job), 200
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
\ No newline at end of file
+    start_warm_up()
+    app.run(host="0.0.0.0", port=8080)